@@ -0,0 +1,84 @@
+"""
+Measures how well a running FUSE mount serves several clients at once.
+
+Readers stream the start of different files in parallel while a scanner keeps listing
+directories and stating files, like a media server scanning the library during playback.
+Run it once with FUSE_MULTITHREADED=false and once with FUSE_MULTITHREADED=true and compare.
+
+    python benchmarks/fuse_concurrency.py /torbox --readers 4 --read-size 64
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import os
+import statistics
+import threading
+import time
+
+def findFiles(root: str, limit: int):
+    files = []
+    for folder in ("movies", "series"):
+        for directory, _, names in os.walk(os.path.join(root, folder)):
+            for name in names:
+                files.append(os.path.join(directory, name))
+                if len(files) >= limit:
+                    return files
+    return files
+
+def readFile(path: str, size: int, chunk_size: int):
+    read = 0
+    with open(path, "rb") as file:
+        while read < size:
+            chunk = file.read(min(chunk_size, size - read))
+            if not chunk:
+                break
+            read += len(chunk)
+    return read
+
+def scanLibrary(root: str, stop: threading.Event, latencies: list):
+    while not stop.is_set():
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if stop.is_set():
+                    return
+                started = time.perf_counter()
+                os.stat(os.path.join(directory, name))
+                latencies.append(time.perf_counter() - started)
+
+def percentile(values: list, fraction: float):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def main():
+    parser = argparse.ArgumentParser(description="FUSE mount concurrency benchmark")
+    parser.add_argument("mount_path", help="Path of the running FUSE mount")
+    parser.add_argument("--readers", type=int, default=4, help="Number of files read in parallel")
+    parser.add_argument("--read-size", type=int, default=64, help="Megabytes read from the start of each file")
+    parser.add_argument("--chunk-size", type=int, default=128, help="Kilobytes per read call")
+    args = parser.parse_args()
+
+    files = findFiles(args.mount_path, args.readers)
+    if not files:
+        raise SystemExit(f"No files found in {args.mount_path}")
+
+    stop = threading.Event()
+    latencies = []
+    scanner = threading.Thread(target=scanLibrary, args=(args.mount_path, stop, latencies), daemon=True)
+    scanner.start()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(files)) as executor:
+        total = sum(executor.map(lambda path: readFile(path, args.read_size * 1024 * 1024, args.chunk_size * 1024), files))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    scanner.join()
+
+    print(f"Readers:          {len(files)}")
+    print(f"Read:             {total / (1024 * 1024):.1f} MB in {elapsed:.2f}s ({total / (1024 * 1024) / elapsed:.1f} MB/s)")
+    print(f"Stats during read: {len(latencies)}")
+    if latencies:
+        print(f"Stat latency:     p50 {statistics.median(latencies) * 1000:.2f} ms, p95 {percentile(latencies, 0.95) * 1000:.2f} ms, max {max(latencies) * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Measures how fast a strm library is generated from scratch.
+
+Writes synthetic downloads the way runStrm did before, one file after the other with a folder
+creation for each, and then with the bulk writer at several worker counts. Point --path at the
+storage the library lives on to measure it, or use --latency to add a delay to every folder
+creation and file write to emulate network storage on a local disk.
+
+    python benchmarks/strm_write.py --files 50000 --workers 1 8 32 --path /mnt/nas/strm-bench
+"""
+import argparse
+import builtins
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser(description="strm generation benchmark")
+parser.add_argument("--files", type=int, default=20000, help="Number of strm files to generate")
+parser.add_argument("--workers", type=int, nargs="+", default=[1, 8, 32], help="Worker counts to try")
+parser.add_argument("--path", default=None, help="Folder to generate in, a temporary folder by default")
+parser.add_argument("--latency", type=float, default=0, help="Milliseconds added to every folder creation and file write")
+args = parser.parse_args()
+
+work_path = args.path or tempfile.mkdtemp(prefix="strm-bench-")
+os.environ["MOUNT_PATH"] = os.path.join(work_path, "library")
+os.environ["STRM_MANIFEST_PATH"] = os.path.join(work_path, "strm_manifest.json")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions import stremFilesystemFunctions # noqa: E402
+
+def createDownloads(count: int):
+    downloads = []
+    for index in range(count):
+        if index % 3 == 0:
+            title = f"Movie {index // 3} ({1950 + index % 70})"
+            downloads.append({
+                "metadata_mediatype": "movie",
+                "metadata_rootfoldername": title,
+                "metadata_foldername": None,
+                "metadata_filename": title,
+                "download_link": f"https://api.torbox.app/v1/api/torrents/requestdl?torrent_id={index}&file_id=0&redirect=true",
+            })
+        else:
+            show = f"Show {index // 200} ({1990 + index // 200 % 30})"
+            season = index // 20 % 10 + 1
+            episode = index % 20 + 1
+            downloads.append({
+                "metadata_mediatype": "series",
+                "metadata_rootfoldername": show,
+                "metadata_foldername": f"Season {season}",
+                "metadata_filename": f"{show} S{season:02d}E{episode:02d}",
+                "download_link": f"https://api.torbox.app/v1/api/torrents/requestdl?torrent_id={index // 20}&file_id={index % 20}&redirect=true",
+            })
+    return downloads
+
+def addLatency(latency: float):
+    """
+    Delays every folder creation and file write by latency seconds, like a round trip to a NAS.
+    """
+    makedirs = os.makedirs
+    open_file = builtins.open
+
+    def slowMakedirs(*a, **kw):
+        time.sleep(latency)
+        return makedirs(*a, **kw)
+
+    def slowOpen(file, mode="r", *a, **kw):
+        if "w" in mode and str(file).startswith(work_path):
+            time.sleep(latency)
+        return open_file(file, mode, *a, **kw)
+
+    os.makedirs = slowMakedirs
+    builtins.open = slowOpen
+
+def reset():
+    shutil.rmtree(os.environ["MOUNT_PATH"], ignore_errors=True)
+    if os.path.exists(os.environ["STRM_MANIFEST_PATH"]):
+        os.remove(os.environ["STRM_MANIFEST_PATH"])
+
+def writeSerial(downloads: list):
+    for download in downloads:
+        file_path = stremFilesystemFunctions.generateFolderPath(download)
+        stremFilesystemFunctions.generateStremFile(file_path, download.get("download_link"), download.get("metadata_mediatype"), download.get("metadata_filename"))
+
+def report(name: str, elapsed: float):
+    print(f"  {name:<12} {elapsed:7.2f}s, {args.files / elapsed:9.0f} files/s")
+
+def main():
+    downloads = createDownloads(args.files)
+    folders = {os.path.dirname(stremFilesystemFunctions.getStremFilePath(d)) for d in downloads}
+    if args.latency:
+        addLatency(args.latency / 1000)
+    print(f"{args.files} files in {len(folders)} folders, {args.latency:g} ms added latency, writing to {work_path}")
+
+    try:
+        reset()
+        started = time.perf_counter()
+        writeSerial(downloads)
+        report("serial", time.perf_counter() - started)
+
+        for workers in args.workers:
+            reset()
+            stremFilesystemFunctions.STRM_WRITE_WORKERS = workers
+            started = time.perf_counter()
+            counts = stremFilesystemFunctions.reconcileStrm(downloads)
+            report(f"{workers} workers", time.perf_counter() - started)
+            assert counts["created"] == args.files and not counts["failed"], counts
+    finally:
+        reset()
+        if not args.path:
+            shutil.rmtree(work_path, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Measures the memory and lookup speed of the FUSE virtual filesystem for large libraries.
+
+Compares the VFS with the layout it replaced, a dict of sorted listings and a dict of paths to
+records, with and without a precomputed stat object per path. That layout keeps every record
+alive for as long as the mount runs, the VFS only keeps its nodes and a fingerprint per file to
+diff the next refresh against. Records are loaded from JSON inside each measurement, like they
+are from the database, so whatever a layout keeps of them is counted.
+
+    python benchmarks/vfs_memory.py --sizes 10000 100000 500000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions.fuseFilesystemFunctions import VirtualFileSystem, diffFiles, getFilePath, getInode, getFileTimestamp # noqa: E402
+from functions.cacheFunctions import getFileCacheKey # noqa: E402
+
+class FlatStat:
+    def __init__(self, mode, inode, size, timestamp):
+        self.st_mode = mode
+        self.st_ino = inode
+        self.st_dev = 0
+        self.st_nlink = 1
+        self.st_uid = 0
+        self.st_gid = 0
+        self.st_size = size
+        self.st_atime = timestamp
+        self.st_mtime = timestamp
+        self.st_ctime = timestamp
+
+def createRecords(count: int):
+    records = []
+    for index in range(count):
+        if index % 3 == 0:
+            title = f"Movie {index // 3} ({1950 + index % 70})"
+            records.append({
+                "type": "torrents",
+                "item_id": index,
+                "file_id": 0,
+                "file_name": f"{title}.mkv",
+                "file_size": random.randint(1, 50) * 1024 ** 3,
+                "download_link": f"https://api.torbox.app/v1/api/torrents/requestdl?torrent_id={index}&file_id=0&redirect=true",
+                "created_at": "2024-05-01T12:00:00Z",
+                "metadata_mediatype": "movie",
+                "metadata_rootfoldername": title,
+                "metadata_foldername": None,
+                "metadata_filename": f"{title}.mkv",
+            })
+        else:
+            show = f"Show {index // 200} ({1990 + index // 200 % 30})"
+            season = index // 20 % 10 + 1
+            episode = index % 20 + 1
+            records.append({
+                "type": "torrents",
+                "item_id": index // 20,
+                "file_id": index % 20,
+                "file_name": f"{show} S{season:02d}E{episode:02d}.mkv",
+                "file_size": random.randint(1, 4) * 1024 ** 3,
+                "download_link": f"https://api.torbox.app/v1/api/torrents/requestdl?torrent_id={index // 20}&file_id={index % 20}&redirect=true",
+                "created_at": "2024-05-01T12:00:00Z",
+                "metadata_mediatype": "series",
+                "metadata_rootfoldername": show,
+                "metadata_foldername": f"Season {season}",
+                "metadata_filename": f"{show} S{season:02d}E{episode:02d}.mkv",
+            })
+    return records
+
+def buildFlat(records: list, with_stats: bool):
+    structure = {"/": ["movies", "series"], "/movies": set(), "/series": set()}
+    file_map = {}
+    for f in records:
+        path = getFilePath(f)
+        file_map[path] = f
+        parts = path.split("/")
+        for depth in range(2, len(parts)):
+            directory = "/".join(parts[:depth])
+            structure.setdefault(directory, set()).add(parts[depth])
+    for key in structure:
+        structure[key] = sorted(structure[key])
+    stats = {}
+    if with_stats:
+        for path, f in file_map.items():
+            stats[path] = FlatStat(0o100444, getInode(getFileCacheKey(f)), f.get("file_size"), getFileTimestamp(f))
+        for path in structure:
+            stats[path] = FlatStat(0o40755, getInode(path), 0, 0)
+    return records, structure, file_map, stats
+
+def buildTree(records: list):
+    _, _, file_index = diffFiles({}, records)
+    return VirtualFileSystem(records), file_index
+
+def getFlatStat(layout):
+    structure, file_map = layout[1], layout[2]
+
+    def getStat(path):
+        # stats built on every call, as getattr did before stats were precomputed
+        if path in structure:
+            return FlatStat(0o40755, 0, 0, 0)
+        f = file_map.get(path)
+        if f is None:
+            return None
+        return FlatStat(0o100444, getInode(getFileCacheKey(f)), f.get("file_size", 0), getFileTimestamp(f))
+
+    return getStat
+
+def measure(data: str, build):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build(json.loads(data))
+    elapsed = time.perf_counter() - started
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size, elapsed
+
+def timeLookups(lookup, paths: list):
+    # FUSE hands every call a new path string, copies keep cached string hashes out of the timing
+    paths = [path.encode().decode() for path in paths]
+    started = time.perf_counter()
+    for path in paths:
+        lookup(path)
+    return (time.perf_counter() - started) / len(paths)
+
+def main():
+    parser = argparse.ArgumentParser(description="VFS memory benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 500000], help="Library sizes to build")
+    parser.add_argument("--lookups", type=int, default=100000, help="Number of random paths resolved per layout")
+    args = parser.parse_args()
+
+    random.seed(0)
+    for count in args.sizes:
+        records = createRecords(count)
+        paths = random.choices([getFilePath(f) for f in records], k=args.lookups)
+        data = json.dumps(records)
+        del records
+
+        print(f"{count} files")
+        flat, flat_size, flat_time = measure(data, lambda records: buildFlat(records, False))
+        flat_lookup = timeLookups(getFlatStat(flat), paths)
+        del flat
+        print(f"  records + path maps:         {flat_size / (1024 * 1024):8.1f} MB, built in {flat_time:.2f}s, {flat_lookup * 1e6:.2f} us per stat")
+
+        flat, stats_size, stats_time = measure(data, lambda records: buildFlat(records, True))
+        stats_lookup = timeLookups(flat[3].get, paths)
+        del flat
+        print(f"  records + path maps + stats: {stats_size / (1024 * 1024):8.1f} MB, built in {stats_time:.2f}s, {stats_lookup * 1e6:.2f} us per stat")
+
+        tree, tree_size, tree_time = measure(data, buildTree)
+        tree_lookup = timeLookups(tree[0].get_stat, paths)
+        del tree
+        print(f"  node tree + file index:      {tree_size / (1024 * 1024):8.1f} MB, built in {tree_time:.2f}s, {tree_lookup * 1e6:.2f} us per stat")
+        print(f"  {flat_size / tree_size:.1f}x smaller than path maps, {stats_size / tree_size:.1f}x smaller than path maps with stats")
+
+if __name__ == "__main__":
+    main()
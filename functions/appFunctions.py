@@ -1,21 +1,26 @@
-from functions.torboxFunctions import getUserDownloads, DownloadType
+from functions.torboxFunctions import syncAllUserDownloads, DownloadType, metadata_cache
 from library.filesystem import MOUNT_METHOD, MOUNT_PATH, SYMLINK_PATH, SYMLINK_CREATION
 from library.app import MOUNT_REFRESH_TIME
 from library.torbox import TORBOX_API_KEY
-from functions.databaseFunctions import getAllData, clearDatabase
+from functions.databaseFunctions import getAllData, clearDatabase, flushDatabase, flushAllDatabases
 import logging
+import asyncio
 import os
 import shutil
 
 def initializeFolders():
     """
     Initialize the necessary folders for the application.
+
+    The strm tree of the last run is kept, so media servers keep seeing the library while it is refreshed.
+    The fuse mount point is emptied, its contents would be hidden by the mount anyway.
     """
     folders = [
         MOUNT_PATH,
         os.path.join(MOUNT_PATH, "movies"),
         os.path.join(MOUNT_PATH, "series"),
     ]
+    symfolders = []
     if SYMLINK_PATH:
         symfolders = [
             SYMLINK_PATH,
@@ -24,11 +29,13 @@ def initializeFolders():
         ]
 
     for folder in folders:
-        if os.path.exists(folder):
+        if os.path.exists(folder) and MOUNT_METHOD == "strm":
+            logging.debug(f"Folder {folder} already exists...")
+        elif os.path.exists(folder):
             logging.debug(f"Folder {folder} already exists. Deleting...")
             for item in os.listdir(folder):
                 item_path = os.path.join(folder, item)
-                if os.path.isdir(item_path):
+                if os.path.isdir(item_path) and not os.path.islink(item_path):
                     shutil.rmtree(item_path)
                 else:
                     os.remove(item_path)
@@ -45,25 +52,27 @@ def initializeFolders():
 
 
 def getAllUserDownloadsFresh():
-    all_downloads = []
+    """
+    Syncs the downloads of every type with the account and returns how many files the library has.
+
+    This is the blocking entry point the scheduler calls.
+    """
+    total = 0
     logging.info("Fetching all user downloads...")
-    for download_type in DownloadType:
-        logging.debug(f"Clearing database for {download_type.value}...")
-        success, detail = clearDatabase(download_type.value)
-        if not success:
-            logging.error(f"Error clearing {download_type.value} database: {detail}")
-            continue
-        logging.debug(f"Fetching {download_type.value} downloads...")
-        downloads, success, detail = getUserDownloads(download_type)
+    for download_type, (count, success, detail) in asyncio.run(syncAllUserDownloads()):
         if not success:
             logging.error(f"Error fetching {download_type.value}: {detail}")
             continue
-        if not downloads:
+        if not count:
             logging.info(f"No {download_type.value} downloads found.")
             continue
-        all_downloads.extend(downloads)
-        logging.debug(f"Fetched {len(downloads)} {download_type.value} downloads.")
-    return all_downloads
+        total += count
+        logging.debug(f"Fetched {count} {download_type.value} downloads.")
+    flushAllDatabases()
+    metadata_cache.save()
+    metadata_stats = metadata_cache.stats()
+    logging.info(f"Metadata cache: {metadata_stats['entries']}/{metadata_stats['max_entries']} searches, {metadata_stats['hits']} hits, {metadata_stats['misses']} misses ({metadata_stats['hit_rate']:.1%} hit rate), {metadata_stats['evictions']} evictions")
+    return total
 
 def getAllUserDownloads():
     all_downloads = []
@@ -86,10 +95,10 @@ def bootUp():
     logging.info("TorBox API Key: %s", TORBOX_API_KEY)
     logging.info("Mount refresh time: %s %s", MOUNT_REFRESH_TIME, "hours")
     if SYMLINK_CREATION != 'once':
-        try:
-            os.remove(f"{os.curdir}/symlinks.json")
-        except Exception as e:
-            logging.debug("symlinks database not yet created")
+        success, detail = clearDatabase('symlinks')
+        if not success:
+            logging.debug(f"symlinks database not cleared: {detail}")
+        flushDatabase('symlinks')
     initializeFolders()
 
     return True
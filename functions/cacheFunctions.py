@@ -0,0 +1,731 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+import threading
+import logging
+import json
+import os
+import re
+import time
+
+def getFileCacheKey(file: dict):
+    """
+    Returns a key for a file record that stays the same across library refreshes and restarts.
+    """
+    return f"{file.get('type')}-{file.get('item_id')}-{file.get('file_id')}"
+
+class SingleFlight:
+    """
+    De-duplicates concurrent calls for the same key.
+
+    The first caller for a key runs the function, every caller that arrives while it is still
+    running waits on the same future and gets the same result or exception.
+    """
+    def __init__(self):
+        self.calls = {}
+        self.shared = 0
+        self.lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.calls[key] = future
+            else:
+                self.shared += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+class PartialBlock:
+    """
+    A block that is still being downloaded.
+
+    Readers wait until the bytes they need have arrived instead of waiting for the whole block.
+    """
+    def __init__(self):
+        self.data = bytearray()
+        self.done = False
+        self.error = None
+        self.condition = threading.Condition()
+
+    def append(self, chunk: bytes):
+        with self.condition:
+            self.data.extend(chunk)
+            self.condition.notify_all()
+
+    def finish(self, error: Exception = None):
+        with self.condition:
+            self.done = True
+            self.error = error
+            self.condition.notify_all()
+
+    def read(self, start: int, end: int):
+        """
+        Returns data[start:end] as soon as it has arrived, raising the download error if it never will.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: len(self.data) >= end or self.done)
+            if len(self.data) < end and self.error is not None:
+                raise self.error
+            return bytes(self.data[start:end])
+
+class LinkCache:
+    """
+    Cache of resolved download links that expire after a TTL.
+
+    Links are refreshed in the background once most of their TTL has passed, so readers keep
+    using the current link while a new one is resolved. Expired links are resolved again on
+    the next lookup, and concurrent resolutions of the same key are coalesced.
+    """
+    def __init__(self, resolve, ttl: float, executor, refresh_ratio: float = 0.8):
+        self.resolve = resolve
+        self.ttl = ttl
+        self.refresh_after = ttl * refresh_ratio
+        self.executor = executor
+        self.links = {}
+        self.refreshing = set()
+        self.flights = SingleFlight()
+        self.refreshes = 0
+        self.invalidations = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, source: str):
+        """
+        Returns the link for the key, resolving it from source when it is missing or expired.
+        """
+        with self.lock:
+            entry = self.links.get(key)
+        if entry is not None:
+            link, resolved_at = entry
+            age = time.monotonic() - resolved_at
+            if age < self.ttl:
+                if age >= self.refresh_after:
+                    self._schedule_refresh(key, source)
+                return link
+        return self.flights.do(key, self._resolve, key, source)
+
+    def invalidate(self, key, link: str = None):
+        """
+        Drops the link for the key. When link is given, only drops it if it is still the cached one.
+        """
+        with self.lock:
+            entry = self.links.get(key)
+            if entry is not None and (link is None or entry[0] == link):
+                del self.links[key]
+                self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "links": len(self.links),
+                "refreshes": self.refreshes,
+                "invalidations": self.invalidations,
+                "failures": self.failures,
+            }
+
+    def _resolve(self, key, source):
+        try:
+            link = self.resolve(source)
+        except Exception:
+            with self.lock:
+                self.failures += 1
+            raise
+        with self.lock:
+            self.links[key] = (link, time.monotonic())
+        return link
+
+    def _schedule_refresh(self, key, source):
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+        self.executor.submit(self._refresh, key, source)
+
+    def _refresh(self, key, source):
+        try:
+            self.flights.do(key, self._resolve, key, source)
+            with self.lock:
+                self.refreshes += 1
+        except Exception as e:
+            # keep serving the current link, it is resolved again once it expires
+            logging.debug(f"Error refreshing download link for {key}: {e}")
+        finally:
+            with self.lock:
+                self.refreshing.discard(key)
+
+class ProbeCache:
+    """
+    Pinned cache of the start and end of files, where containers keep the headers and indexes
+    that media servers read when probing a file.
+
+    Segments are fetched in small blocks and kept apart from the block cache, so streaming
+    reads cannot evict them. Once over budget, whole files are dropped least recently used
+    first. When a disk tier is attached, segments are also written to it and survive restarts.
+    """
+    def __init__(self, max_bytes: int, head_size: int, tail_size: int, block_size: int, disk=None):
+        self.max_bytes = max_bytes
+        self.head_size = head_size
+        self.tail_size = tail_size
+        self.block_size = block_size
+        self.disk = disk
+        self.files = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def covers(self, file_size: int, offset: int, end: int):
+        """
+        Returns whether the byte range offset..end - 1 lies completely in the head or tail of a file.
+        """
+        if self.max_bytes <= 0:
+            return False
+        tail_start = self.tail_start(file_size)
+        return end <= self.head_end(file_size) or offset >= tail_start
+
+    def head_end(self, file_size: int):
+        return min(file_size, -(-self.head_size // self.block_size) * self.block_size)
+
+    def tail_start(self, file_size: int):
+        return max(0, (file_size - self.tail_size) // self.block_size * self.block_size)
+
+    def blocks(self, offset: int, end: int):
+        return range(offset // self.block_size, (end - 1) // self.block_size + 1)
+
+    def get(self, file_key: str, block_index: int):
+        with self.lock:
+            blocks = self.files.get(file_key)
+            data = blocks.get(block_index) if blocks is not None else None
+            if data is not None:
+                self.hits += 1
+                self.files.move_to_end(file_key)
+                return data
+        if self.disk is not None:
+            data = self.disk.get(self._disk_key(file_key, block_index))
+            if data is not None:
+                self._store(file_key, block_index, data)
+                with self.lock:
+                    self.hits += 1
+                return data
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def __contains__(self, key):
+        file_key, block_index = key
+        with self.lock:
+            if block_index in self.files.get(file_key, {}):
+                return True
+        return self.disk is not None and self._disk_key(file_key, block_index) in self.disk
+
+    def has_room(self, size: int):
+        with self.lock:
+            return self.size + size <= self.max_bytes
+
+    def put(self, file_key: str, block_index: int, data: bytes):
+        if self.disk is not None:
+            self.disk.put(self._disk_key(file_key, block_index), data)
+        self._store(file_key, block_index, data)
+
+    def invalidate(self, file_key: str):
+        with self.lock:
+            blocks = self.files.pop(file_key, {})
+            self.size -= sum(len(data) for data in blocks.values())
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": self.size,
+                "max_size": self.max_bytes,
+                "files": len(self.files),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _store(self, file_key, block_index, data):
+        if len(data) > self.max_bytes:
+            return
+        with self.lock:
+            blocks = self.files.setdefault(file_key, {})
+            self.size -= len(blocks.get(block_index, b""))
+            blocks[block_index] = data
+            self.size += len(data)
+            self.files.move_to_end(file_key)
+            while self.size > self.max_bytes:
+                _, evicted = self.files.popitem(last=False)
+                self.size -= sum(len(block) for block in evicted.values())
+                self.evictions += 1
+
+    def _disk_key(self, file_key, block_index):
+        # the block size is part of the name so blocks of another probe size never match
+        return (file_key, f"probe{self.block_size}-{block_index}")
+
+class BlockCache:
+    """
+    Thread-safe LRU cache for file blocks.
+
+    Blocks are keyed by (file_key, block_index). The cache is bounded by a global byte budget
+    and by a per-file byte cap so a single large file cannot push every other file out.
+    When a disk tier is attached, new blocks are also written to disk and memory misses fall
+    through to it.
+    """
+    def __init__(self, max_bytes: int, max_file_bytes: int, disk=None):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = min(max_file_bytes, max_bytes)
+        self.disk = disk
+        self.blocks = OrderedDict()
+        self.files = {}
+        self.file_bytes = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the cached block for the key or None, marking it as most recently used.
+        """
+        file_key, block_index = key
+        with self.lock:
+            data = self.blocks.get(key)
+            if data is not None:
+                self.hits += 1
+                self.blocks.move_to_end(key)
+                self.files[file_key].move_to_end(block_index)
+            else:
+                self.misses += 1
+        if data is not None:
+            if self.disk is not None:
+                self.disk.touch(key)
+            return data
+
+        if self.disk is not None:
+            data = self.disk.get(key)
+            if data is not None:
+                self._store(key, data)
+        return data
+
+    def __contains__(self, key):
+        with self.lock:
+            if key in self.blocks:
+                return True
+        return self.disk is not None and key in self.disk
+
+    def put(self, key, data: bytes):
+        """
+        Stores a block, evicting least recently used blocks until both the per-file and global budgets are met.
+        """
+        if self.disk is not None:
+            self.disk.put(key, data)
+        self._store(key, data)
+
+    def invalidate(self, file_key: str):
+        """
+        Drops every cached block belonging to a file.
+        """
+        with self.lock:
+            for block_index in list(self.files.get(file_key, ())):
+                self._remove((file_key, block_index))
+        if self.disk is not None:
+            self.disk.invalidate(file_key)
+
+    def clear(self):
+        with self.lock:
+            self.blocks.clear()
+            self.files.clear()
+            self.file_bytes.clear()
+            self.size = 0
+
+    def flush(self):
+        """
+        Persists the disk tier index, if there is one.
+        """
+        if self.disk is not None:
+            self.disk.save_index()
+
+    def stats(self):
+        """
+        Returns a snapshot of the cache counters for sizing the cache.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "size": self.size,
+                "max_size": self.max_bytes,
+                "blocks": len(self.blocks),
+                "files": len(self.files),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+    def _store(self, key, data):
+        file_key, block_index = key
+        if len(data) > self.max_file_bytes:
+            logging.debug(f"Block {block_index} of {file_key} is larger than the per-file cache cap. Not caching")
+            return
+        with self.lock:
+            if key in self.blocks:
+                self._remove(key)
+            self.blocks[key] = data
+            self.files.setdefault(file_key, OrderedDict())[block_index] = None
+            self.file_bytes[file_key] = self.file_bytes.get(file_key, 0) + len(data)
+            self.size += len(data)
+
+            file_blocks = self.files[file_key]
+            while self.file_bytes[file_key] > self.max_file_bytes:
+                self._remove((file_key, next(iter(file_blocks))))
+                self.evictions += 1
+
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.blocks)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        # caller must hold self.lock
+        file_key, block_index = key
+        data = self.blocks.pop(key)
+        self.size -= len(data)
+        file_blocks = self.files[file_key]
+        del file_blocks[block_index]
+        self.file_bytes[file_key] -= len(data)
+        if not file_blocks:
+            del self.files[file_key]
+            del self.file_bytes[file_key]
+
+class DiskCache:
+    """
+    LRU cache of file blocks stored as one file per block in a local directory.
+
+    Blocks are written in the background, read back as bytes so no file stays open while they are
+    kept in memory, and tracked in an index that is persisted next to them so the cache and its
+    LRU order survive restarts. Blocks still waiting to be written take up to max_queued_bytes,
+    writes beyond that are dropped so a slow disk can't hold on to memory outside the cache budget.
+    """
+    INDEX_FILE = "index.json"
+    # blocks of files and of the probe cache, and their partial writes, nothing else in the folder is touched
+    BLOCK_NAME_PATTERN = re.compile(r"[a-z]+-\w+-\w+\.(probe\d+-)?\d+(\.tmp)?")
+
+    def __init__(self, path: str, max_bytes: int, block_size: int, max_queued_bytes: int = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.block_size = block_size
+        self.max_queued_bytes = 32 * block_size if max_queued_bytes is None else max_queued_bytes
+        self.queued_bytes = 0
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="diskcache")
+        os.makedirs(self.path, exist_ok=True)
+        self._load_index()
+
+    def get(self, key):
+        """
+        Returns the cached block or None.
+
+        A block that is gone or empty is dropped from the index, other errors such as running out of
+        file descriptors only count as a miss.
+        """
+        name = self._name(key)
+        with self.lock:
+            if name not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(name)
+        try:
+            with open(os.path.join(self.path, name), "rb") as file:
+                data = file.read()
+            if not data:
+                raise ValueError("cached block is empty")
+        except (FileNotFoundError, ValueError) as e:
+            logging.debug(f"Cached block {name} is missing or corrupt: {e}")
+            with self.lock:
+                self._remove(name)
+                self.misses += 1
+            return None
+        except OSError as e:
+            logging.debug(f"Cannot read cached block {name}: {e}")
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def __contains__(self, key):
+        with self.lock:
+            return self._name(key) in self.entries
+
+    def touch(self, key):
+        with self.lock:
+            name = self._name(key)
+            if name in self.entries:
+                self.entries.move_to_end(name)
+
+    def put(self, key, data: bytes):
+        """
+        Queues a block to be written to disk, or drops it when the queue is full.
+        """
+        if len(data) > self.max_bytes:
+            return
+        name = self._name(key)
+        with self.lock:
+            if name in self.entries:
+                self.entries.move_to_end(name)
+                return
+            if self.queued_bytes + len(data) > self.max_queued_bytes:
+                self.dropped += 1
+                return
+            self.queued_bytes += len(data)
+        self.writer.submit(self._write, name, bytes(data))
+
+    def invalidate(self, file_key: str):
+        prefix = f"{file_key}."
+        with self.lock:
+            for name in [name for name in self.entries if name.startswith(prefix)]:
+                self._remove(name)
+
+    def save_index(self):
+        """
+        Atomically writes the index of cached blocks in LRU order.
+        """
+        with self.lock:
+            index = {
+                "block_size": self.block_size,
+                "entries": list(self.entries.items()),
+            }
+        index_path = os.path.join(self.path, self.INDEX_FILE)
+        try:
+            with open(f"{index_path}.tmp", "w") as file:
+                json.dump(index, file)
+            os.replace(f"{index_path}.tmp", index_path)
+        except OSError as e:
+            logging.error(f"Error saving disk cache index: {e}")
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": self.size,
+                "max_size": self.max_bytes,
+                "blocks": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "dropped": self.dropped,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    def _name(self, key):
+        file_key, block_index = key
+        return f"{file_key}.{block_index}"
+
+    def _write(self, name, data):
+        block_path = os.path.join(self.path, name)
+        try:
+            with open(f"{block_path}.tmp", "wb") as file:
+                file.write(data)
+            os.replace(f"{block_path}.tmp", block_path)
+        except OSError as e:
+            logging.error(f"Error writing block {name} to disk cache: {e}")
+            with self.lock:
+                self.queued_bytes -= len(data)
+            return
+        with self.lock:
+            self.queued_bytes -= len(data)
+            if name in self.entries:
+                self.size -= self.entries[name]
+            self.entries[name] = len(data)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def _remove(self, name):
+        # caller must hold self.lock
+        size = self.entries.pop(name, None)
+        if size is None:
+            return
+        self.size -= size
+        try:
+            os.remove(os.path.join(self.path, name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.error(f"Error removing block {name} from disk cache: {e}")
+
+    def _load_index(self):
+        """
+        Restores the index from a previous run, dropping blocks that no longer match it.
+        """
+        index = {}
+        try:
+            with open(os.path.join(self.path, self.INDEX_FILE)) as file:
+                index = json.load(file)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.error(f"Disk cache index is unreadable, starting empty: {e}")
+
+        on_disk = {
+            name: os.path.getsize(os.path.join(self.path, name))
+            for name in os.listdir(self.path)
+            if self.BLOCK_NAME_PATTERN.fullmatch(name) and os.path.isfile(os.path.join(self.path, name))
+        }
+        if index.get("block_size") == self.block_size:
+            for name, size in index.get("entries", []):
+                if on_disk.get(name) == size:
+                    self.entries[name] = on_disk.pop(name)
+                    self.size += size
+
+        # anything left over is a partial write or from another block size
+        for name in on_disk:
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError as e:
+                logging.error(f"Error removing stale block {name} from disk cache: {e}")
+
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+        logging.info(f"Loaded {len(self.entries)} blocks ({self.size / (1024 * 1024):.1f} MB) from disk cache at {self.path}")
+
+def getMetadataCacheKey(query: str):
+    """
+    Returns the key a metadata search is cached under, searches differing only in case or spacing share it.
+    """
+    return " ".join(query.lower().split())
+
+class MetadataCache:
+    """
+    Persistent cache of metadata search results keyed by normalized query.
+
+    Found results, misses and errors each expire after their own TTL, so searches without a
+    result and failed searches are retried sooner than found ones. The least recently used
+    entries are dropped beyond max_entries. save writes the cache to path so a restart keeps
+    everything that was already resolved.
+    """
+    FOUND = "found"
+    MISSING = "missing"
+    ERROR = "error"
+
+    def __init__(self, path: str, max_entries: int, ttl: float, miss_ttl: float, error_ttl: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttls = {
+            self.FOUND: ttl,
+            self.MISSING: miss_ttl,
+            self.ERROR: error_ttl,
+        }
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self._load()
+
+    def get(self, key: str):
+        """
+        Returns the (status, data) cached for the key, or None if it is missing or expired.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[2] <= time.time():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key: str, status: str, data: dict = None):
+        ttl = self.ttls[status]
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (status, data, time.time() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def is_expired(self, status: str, checked_at: float):
+        """
+        Returns whether a search with this status made at checked_at would have expired from the cache by now.
+        """
+        ttl = self.ttls.get(status)
+        return ttl is None or checked_at + ttl <= time.time()
+
+    def save(self):
+        """
+        Atomically writes the cache in LRU order.
+        """
+        with self.lock:
+            entries = [[key, *entry] for key, entry in self.entries.items()]
+        try:
+            with open(f"{self.path}.tmp", "w") as file:
+                json.dump({"entries": entries}, file)
+            os.replace(f"{self.path}.tmp", self.path)
+        except OSError as e:
+            logging.error(f"Error saving metadata cache: {e}")
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _load(self):
+        try:
+            with open(self.path) as file:
+                entries = json.load(file).get("entries", [])
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, AttributeError) as e:
+            logging.error(f"Metadata cache is unreadable, starting empty: {e}")
+            return
+        now = time.time()
+        try:
+            for key, status, data, expires_at in entries:
+                if status in self.ttls and expires_at > now:
+                    self.entries[key] = (status, data, expires_at)
+        except (TypeError, ValueError) as e:
+            logging.error(f"Metadata cache has malformed entries, starting empty: {e}")
+            self.entries.clear()
+            return
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        logging.info(f"Loaded {len(self.entries)} metadata search results from {self.path}")
@@ -1,120 +1,469 @@
 from tinydb import TinyDB, Query
+from tinydb.storages import Storage
+from tinydb.middlewares import CachingMiddleware
+from tinydb.table import Document
+from library.database import DATABASE_BACKEND, DATABASE_PATH
+from functions.mediaFunctions import getFilePath
+import contextlib
 import threading
 import logging
+import sqlite3
+import json
+import os
 
 db_connections = {}
-db_locks = {}
 global_lock = threading.Lock()
 
+# fields that can be looked up without reading the whole database, mount_path is the path of the file inside the mount
+INDEXED_FIELDS = ["item_id", "file_id", "symlink_path", "mount_path"]
+
+def getRecordPath(data: dict):
+    """
+    Returns the path inside the mount of a stored file, or None for records without metadata.
+    """
+    if not data.get("metadata_filename"):
+        return None
+    return getFilePath(data)
+
+class AtomicJSONStorage(Storage):
+    """
+    TinyDB storage that writes the whole database to a temporary file and renames it over the old one.
+
+    A crash while writing leaves either the previous or the new file, never a truncated one.
+    """
+    def __init__(self, path: str, **kwargs):
+        self.path = path
+        self.kwargs = kwargs
+
+    def read(self):
+        try:
+            with open(self.path) as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        if not data.strip():
+            return None
+        return json.loads(data)
+
+    def write(self, data):
+        with open(f"{self.path}.tmp", "w") as file:
+            json.dump(data, file, **self.kwargs)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def close(self):
+        pass
+
+class JSONDatabase:
+    """
+    A database kept in a TinyDB JSON file, read fully into memory and written to disk in batches.
+
+    Every operation takes the same lock.
+    """
+    def __init__(self, name: str):
+        self.db = TinyDB(f"{name}.json", storage=CachingMiddleware(AtomicJSONStorage))
+        self.lock = threading.Lock()
+
+    def insert(self, data: dict):
+        with self.lock:
+            self.db.insert(data)
+
+    def insert_multiple(self, data: list):
+        with self.lock:
+            self.db.insert_multiple(data)
+
+    def replace_multiple(self, doc_ids: list, data: list):
+        with self.lock:
+            self.db.insert_multiple(data)
+            self.db.remove(doc_ids=doc_ids)
+
+    def remove_item(self, item_id):
+        with self.lock:
+            self.db.remove(Query().item_id == item_id)
+
+    def remove_ids(self, doc_ids: list):
+        with self.lock:
+            self.db.remove(doc_ids=doc_ids)
+
+    def remove_field(self, field: str, value):
+        with self.lock:
+            if field == "mount_path":
+                self.db.remove(doc_ids=[document.doc_id for document in self.db.all() if getRecordPath(document) == value])
+            else:
+                self.db.remove(Query()[field] == value)
+
+    def find(self, field: str, value):
+        with self.lock:
+            if field == "mount_path":
+                return [document for document in self.db.all() if getRecordPath(document) == value]
+            return self.db.search(Query()[field] == value)
+
+    def all(self):
+        with self.lock:
+            return self.db.all()
+
+    def truncate(self):
+        with self.lock:
+            self.db.truncate()
+
+    def flush(self):
+        with self.lock:
+            self.db.storage.flush()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class SQLiteDatabase:
+    """
+    A database kept as a table of an SQLite file in WAL mode, with an index on each of INDEXED_FIELDS.
+
+    Records are stored as JSON next to the indexed columns and come back as TinyDB documents, so
+    callers see the same doc_ids and dicts as with the JSON backend. Writes are committed as they
+    happen and take a lock, reads use their own connection and are not held up by a writer.
+
+    A table that doesn't exist yet is filled from the JSON file of the same name once, which is then
+    renamed to {name}.json.migrated. Tables that kept the mount path in a column named path get a
+    mount_path column copied from it.
+    """
+    def __init__(self, path: str, name: str):
+        self.path = path
+        self.name = name
+        self.table = f'"{name}"'
+        self.idle = []
+        self.pool_lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self._create()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    @contextlib.contextmanager
+    def _connection(self):
+        # connections are handed to one thread at a time and reused, threads come and go with each sync
+        with self.pool_lock:
+            connection = self.idle.pop() if self.idle else None
+        if connection is None:
+            connection = self._connect()
+        try:
+            yield connection
+        finally:
+            with self.pool_lock:
+                self.idle.append(connection)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        with self.write_lock, self._connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def _create(self):
+        json_path = f"{self.name}.json"
+        with self._transaction() as connection:
+            exists = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.name,)).fetchone()
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (doc_id INTEGER PRIMARY KEY, item_id, file_id, symlink_path TEXT, mount_path TEXT, data TEXT NOT NULL)")
+            columns = {row[1] for row in connection.execute(f"PRAGMA table_info({self.table})")}
+            if "mount_path" not in columns:
+                connection.execute(f"ALTER TABLE {self.table} ADD COLUMN mount_path TEXT")
+                connection.execute(f"UPDATE {self.table} SET mount_path = path")
+                connection.execute(f'DROP INDEX IF EXISTS "{self.name}_path"')
+            for field in INDEXED_FIELDS:
+                connection.execute(f'CREATE INDEX IF NOT EXISTS "{self.name}_{field}" ON {self.table} ({field})')
+            migrate = not exists and os.path.exists(json_path)
+            if migrate:
+                with open(json_path) as file:
+                    content = file.read()
+                documents = json.loads(content).get("_default", {}) if content.strip() else {}
+                connection.executemany(
+                    f"INSERT INTO {self.table} (doc_id, item_id, file_id, symlink_path, mount_path, data) VALUES (?, ?, ?, ?, ?, ?)",
+                    ((int(doc_id),) + self._columns(data) for doc_id, data in documents.items()),
+                )
+        if migrate:
+            os.replace(json_path, f"{json_path}.migrated")
+            logging.info(f"Migrated {len(documents)} records from {json_path} to {self.path}")
+
+    def _columns(self, data: dict):
+        return (data.get("item_id"), data.get("file_id"), data.get("symlink_path"), getRecordPath(data), json.dumps(data))
+
+    def _documents(self, rows):
+        return [Document(json.loads(data), doc_id) for doc_id, data in rows]
+
+    def insert(self, data: dict):
+        self.insert_multiple([data])
+
+    def insert_multiple(self, data: list):
+        with self._transaction() as connection:
+            connection.executemany(
+                f"INSERT INTO {self.table} (item_id, file_id, symlink_path, mount_path, data) VALUES (?, ?, ?, ?, ?)",
+                (self._columns(document) for document in data),
+            )
+
+    def replace_multiple(self, doc_ids: list, data: list):
+        with self._transaction() as connection:
+            connection.executemany(
+                f"INSERT INTO {self.table} (item_id, file_id, symlink_path, mount_path, data) VALUES (?, ?, ?, ?, ?)",
+                (self._columns(document) for document in data),
+            )
+            connection.executemany(f"DELETE FROM {self.table} WHERE doc_id = ?", ((doc_id,) for doc_id in doc_ids))
+
+    def remove_item(self, item_id):
+        with self._transaction() as connection:
+            connection.execute(f"DELETE FROM {self.table} WHERE item_id = ?", (item_id,))
+
+    def remove_ids(self, doc_ids: list):
+        with self._transaction() as connection:
+            connection.executemany(f"DELETE FROM {self.table} WHERE doc_id = ?", ((doc_id,) for doc_id in doc_ids))
+
+    def remove_field(self, field: str, value):
+        with self._transaction() as connection:
+            connection.execute(f"DELETE FROM {self.table} WHERE {field} = ?", (value,))
+
+    def find(self, field: str, value):
+        with self._connection() as connection:
+            return self._documents(connection.execute(f"SELECT doc_id, data FROM {self.table} WHERE {field} = ? ORDER BY doc_id", (value,)))
+
+    def all(self):
+        with self._connection() as connection:
+            return self._documents(connection.execute(f"SELECT doc_id, data FROM {self.table} ORDER BY doc_id"))
+
+    def truncate(self):
+        with self._transaction() as connection:
+            connection.execute(f"DELETE FROM {self.table}")
+
+    def flush(self):
+        # every write is committed right away
+        pass
+
+    def close(self):
+        with self.pool_lock:
+            connections, self.idle = self.idle, []
+        for connection in connections:
+            connection.close()
+
 def getDatabase(name: str = "db"):
     """
-    Returns the TinyDB database instance with thread-safe storage.
+    Returns the database instance of the configured backend with thread-safe storage.
     Uses a connection pool pattern to avoid creating multiple connections.
+    The JSON backend keeps writes in memory and writes them to disk in batches, call flushDatabase to write them right away.
     """
-    global db_connections, db_locks # global cause I'm lazy
-    
+    global db_connections # global cause I'm lazy
+
     with global_lock:
         if name not in db_connections:
             try:
-                db_connections[name] = TinyDB(f"{name}.json")
-                db_locks[name] = threading.Lock()
+                if DATABASE_BACKEND == "sqlite":
+                    db_connections[name] = SQLiteDatabase(DATABASE_PATH, name)
+                else:
+                    db_connections[name] = JSONDatabase(name)
             except Exception as e:
                 logging.error(f"Error connecting to the database: {e}")
                 return None
-    
-    return db_connections[name]
 
-def getDatabaseLock(name: str = "db"):
-    """
-    Returns the lock for the specified database.
-    """
-    global db_locks
-    
-    getDatabase(name)
-    return db_locks.get(name)
+    return db_connections[name]
 
 def clearDatabase(type: str):
     """
     Clears the entire database with thread safety.
     """
     db = getDatabase(type)
-    db_lock = getDatabaseLock(type)
-    
-    if db is None or db_lock is None:
+
+    if db is None:
         return False, "Database connection failed."
-    
-    with db_lock:
-        try:
-            db.truncate()
-            return True, "Database cleared successfully."
-        except Exception as e:
-            return False, f"Error clearing the database: {e}"
-    
+
+    try:
+        db.truncate()
+        return True, "Database cleared successfully."
+    except Exception as e:
+        return False, f"Error clearing the database: {e}"
+
 def insertData(data: dict, type: str):
     """
     Inserts data into the database with thread safety.
     """
     db = getDatabase(type)
-    db_lock = getDatabaseLock(type)
-    
-    if db is None or db_lock is None:
+
+    if db is None:
         return False, "Database connection failed."
-    
-    with db_lock:
-        try:
-            db.insert(data)
-            return True, "Data inserted successfully."
-        except Exception as e:
-            return False, f"Error inserting data. {e}"
-    
+
+    try:
+        db.insert(data)
+        return True, "Data inserted successfully."
+    except Exception as e:
+        return False, f"Error inserting data. {e}"
+
+
+def insertMultipleData(data: list, type: str):
+    """
+    Inserts several documents in a single write with thread safety.
+    """
+    db = getDatabase(type)
+
+    if db is None:
+        return False, "Database connection failed."
+
+    if not data:
+        return True, "No data to insert."
+
+    try:
+        db.insert_multiple(data)
+        return True, "Data inserted successfully."
+    except Exception as e:
+        return False, f"Error inserting data. {e}"
+
+def replaceMultipleData(doc_ids: list, data: list, type: str):
+    """
+    Inserts several documents and deletes the documents they replace by document id in a single write with thread safety.
+
+    Readers see either the old or the new documents, never neither.
+    """
+    db = getDatabase(type)
+
+    if db is None:
+        return False, "Database connection failed."
+
+    if not doc_ids and not data:
+        return True, "No data to replace."
+
+    try:
+        db.replace_multiple(doc_ids, data)
+        return True, "Data replaced successfully."
+    except Exception as e:
+        return False, f"Error replacing data. {e}"
 
 def deleteData(data: dict, type: str):
     """
     Deletes data from the database with thread safety.
     """
     db = getDatabase(type)
-    db_lock = getDatabaseLock(type)
-    
-    if db is None or db_lock is None:
+
+    if db is None:
         return False, "Database connection failed."
-    
-    with db_lock:
-        rem_query = Query()
-        try:
-            db.remove(rem_query.item_id == data.get('item_id',None))
-            return True, "Data removed successfully."
-        except Exception as e:
-            return False, f"Error removing data. {e}"
-    
+
+    try:
+        db.remove_item(data.get('item_id',None))
+        return True, "Data removed successfully."
+    except Exception as e:
+        return False, f"Error removing data. {e}"
+
+def deleteDataByIds(doc_ids: list, type: str):
+    """
+    Deletes documents by their document ids in a single write with thread safety.
+    """
+    db = getDatabase(type)
+
+    if db is None:
+        return False, "Database connection failed."
+
+    if not doc_ids:
+        return True, "No data to remove."
+
+    try:
+        db.remove_ids(list(doc_ids))
+        return True, "Data removed successfully."
+    except Exception as e:
+        return False, f"Error removing data. {e}"
+
+def deleteDataByField(field: str, value, type: str):
+    """
+    Deletes the documents whose field equals value with thread safety, field must be one of INDEXED_FIELDS.
+    """
+    if field not in INDEXED_FIELDS:
+        return False, f"Cannot remove data by {field}, use one of {INDEXED_FIELDS}."
+
+    db = getDatabase(type)
+
+    if db is None:
+        return False, "Database connection failed."
+
+    try:
+        db.remove_field(field, value)
+        return True, "Data removed successfully."
+    except Exception as e:
+        return False, f"Error removing data. {e}"
+
 def getAllData(type: str):
     """
     Retrieves all data from the database with thread safety.
     """
     db = getDatabase(type)
-    db_lock = getDatabaseLock(type)
-    
-    if db is None or db_lock is None:
+
+    if db is None:
         return None, False, "Database connection failed."
-    
-    with db_lock:
-        try:
-            data = db.all()
-            return data, True, "Data retrieved successfully."
-        except Exception as e:
-            return None, False, f"Error retrieving data. {e}"
+
+    try:
+        data = db.all()
+        return data, True, "Data retrieved successfully."
+    except Exception as e:
+        return None, False, f"Error retrieving data. {e}"
+
+def getDataByField(field: str, value, type: str):
+    """
+    Retrieves the documents whose field equals value, field must be one of INDEXED_FIELDS.
+    """
+    if field not in INDEXED_FIELDS:
+        return None, False, f"Cannot look up data by {field}, use one of {INDEXED_FIELDS}."
+
+    db = getDatabase(type)
+
+    if db is None:
+        return None, False, "Database connection failed."
+
+    try:
+        data = db.find(field, value)
+        return data, True, "Data retrieved successfully."
+    except Exception as e:
+        return None, False, f"Error retrieving data. {e}"
+
+def flushDatabase(name: str = "db"):
+    """
+    Writes the pending changes of a database to disk with thread safety.
+    """
+    db = getDatabase(name)
+
+    if db is None:
+        return False, "Database connection failed."
+
+    try:
+        db.flush()
+        return True, "Database flushed successfully."
+    except Exception as e:
+        return False, f"Error flushing database: {e}"
+
+def flushAllDatabases():
+    """
+    Writes the pending changes of all open databases to disk.
+    """
+    with global_lock:
+        names = list(db_connections.keys())
+    flushed_count = 0
+    for name in names:
+        success, detail = flushDatabase(name)
+        if success:
+            flushed_count += 1
+        else:
+            logging.error(f"Error flushing database {name}: {detail}")
+    return True, f"Flushed {flushed_count} databases."
 
 def closeDatabase(name: str = "db"):
     """
     Closes a database connection and removes it from the cache.
     """
-    global db_connections, db_locks
-    
+    global db_connections
+
     with global_lock:
         if name in db_connections:
             try:
                 db_connections[name].close()
                 del db_connections[name]
-                del db_locks[name]
                 return True, "Database closed successfully."
             except Exception as e:
                 return False, f"Error closing database: {e}"
@@ -124,8 +473,8 @@ def closeAllDatabases():
     """
     Closes all database connections.
     """
-    global db_connections, db_locks
-    
+    global db_connections
+
     with global_lock:
         closed_count = 0
         for name in list(db_connections.keys()):
@@ -134,7 +483,6 @@ def closeAllDatabases():
                 closed_count += 1
             except Exception as e:
                 logging.error(f"Error closing database {name}: {e}")
-        
+
         db_connections.clear()
-        db_locks.clear()
-        return True, f"Closed {closed_count} database connections."
\ No newline at end of file
+        return True, f"Closed {closed_count} database connections."
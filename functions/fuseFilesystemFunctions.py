@@ -1,14 +1,22 @@
 import os
-from library.filesystem import MOUNT_PATH, SYMLINK_PATH, SYMLINK_CREATION
+from library.filesystem import MOUNT_PATH, SYMLINK_PATH, SYMLINK_CREATION, FUSE_MULTITHREADED, FUSE_ATTR_TIMEOUT, FUSE_ENTRY_TIMEOUT, FUSE_KERNEL_CACHE
+from library.cache import FUSE_CACHE_SIZE, FUSE_CACHE_FILE_SIZE, FUSE_READAHEAD_BLOCKS, FUSE_READAHEAD_WORKERS, FUSE_DISK_CACHE_PATH, FUSE_DISK_CACHE_SIZE, FUSE_LINK_TTL, FUSE_LINK_RETRIES, FUSE_PROBE_CACHE_SIZE, FUSE_PROBE_HEAD_SIZE, FUSE_PROBE_TAIL_SIZE, FUSE_PROBE_BLOCK_SIZE, FUSE_PROBE_WARM, FUSE_STREAM_FETCH_SIZE
 import stat
 import errno
-from functions.torboxFunctions import getDownloadLink, downloadFile
+from functions.torboxFunctions import getDownloadLink, getApiDownloadLink, streamFile, RangeStream, DownloadLinkExpired
 import time
 import sys
 import logging
 from functions.appFunctions import getAllUserDownloads
-from functions.databaseFunctions import insertData, getAllData, deleteData
+from functions.databaseFunctions import insertData, getAllData, deleteDataByField, flushDatabase
+from functions.cacheFunctions import BlockCache, DiskCache, LinkCache, PartialBlock, ProbeCache, SingleFlight, getFileCacheKey
+from functions.readAheadFunctions import ReadAhead
+from functions.mediaFunctions import getFileComponents, getFilePath
+from concurrent.futures import ThreadPoolExecutor
 import threading
+import hashlib
+import functools
+from datetime import datetime
 from sys import platform
 
 # Pull in some spaghetti to make this stuff work without fuse-py being installed
@@ -23,255 +31,767 @@ if not hasattr(fuse, '__version__'):
 
 fuse.fuse_python_api = (0, 2)
 
+# used for files without a creation time so they still look unchanged between stats
+MOUNT_TIME = int(time.time())
+
+def getInode(key: str):
+    """
+    Returns a deterministic inode number for a key.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") & 0x7FFFFFFFFFFFFFFF or 1
+
+def getFileTimestamp(file: dict):
+    """
+    Returns the creation time of the download a file belongs to as a unix timestamp.
+    """
+    created_at = file.get('created_at')
+    if not created_at:
+        return MOUNT_TIME
+    return parseTimestamp(str(created_at))
+
+@functools.lru_cache(maxsize=65536)
+def parseTimestamp(created_at: str):
+    # all files of a download share its creation time, caching hands them the same int
+    try:
+        return int(datetime.fromisoformat(created_at.replace('Z', '+00:00')).timestamp())
+    except ValueError:
+        return MOUNT_TIME
+
+def isFileListed(file: dict):
+    """
+    Returns whether a file shows up in directory listings, files of other media types are only reachable by path.
+    """
+    return file.get('metadata_mediatype') in ('movie', 'series')
+
+def getFileFingerprint(file: dict):
+    """
+    Returns a hash of the fields of a file the VFS depends on, a file whose fingerprint changes is replaced.
+
+    Fingerprints are only compared within one run, so the per-process hash of Python will do.
+    """
+    return hash((
+        file.get('metadata_mediatype'),
+        file.get('metadata_rootfoldername'),
+        file.get('metadata_foldername'),
+        file.get('metadata_filename'),
+        file.get('file_size'),
+        getFileTimestamp(file),
+    ))
+
+def diffFiles(previous: dict, files: list):
+    """
+    Compares the fingerprints of the previous files, keyed by file cache key, with a new file list.
+
+    Returns the added files, the keys of the removed files, and the fingerprints of the new list to
+    compare the next one with. A file whose fingerprint changed shows up in both.
+    """
+    current = {}
+    added = []
+    for f in files:
+        key = sys.intern(getFileCacheKey(f))
+        fingerprint = getFileFingerprint(f)
+        current[key] = fingerprint
+        if previous.get(key) != fingerprint:
+            added.append(f)
+    removed = [key for key, fingerprint in previous.items() if current.get(key) != fingerprint]
+    return added, removed, current
+
+class FileNode:
+    """
+    A file in the VFS, holding only what getattr and read need from its record.
+
+    The node is its own stat record, fuse-python reads the st_ attributes straight from it. Its
+    API link is built from its key when the file is read, so it isn't kept for every file.
+    """
+    __slots__ = ('key', 'st_ino', 'size', 'mtime')
+
+    st_mode = stat.S_IFREG | 0o444
+    st_nlink = 1
+    st_dev = 0
+    st_uid = os.getuid()
+    st_gid = os.getgid()
+
+    def __init__(self, file: dict):
+        self.key = sys.intern(getFileCacheKey(file))
+        self.st_ino = getInode(self.key)
+        self.size = file.get('file_size') or 0
+        self.mtime = getFileTimestamp(file)
+
+    @property
+    def download_link(self):
+        type, item_id, file_id = self.key.split('-', 2)
+        return getApiDownloadLink(type, item_id, file_id)
+
+    @property
+    def st_size(self):
+        return self.size
+
+    @property
+    def st_mtime(self):
+        return self.mtime
+
+    st_atime = st_ctime = st_mtime
+
+class DirectoryNode:
+    """
+    A directory in the VFS, children maps names to nodes and the sorted listing is built on first use.
+
+    Like files, a directory is its own stat record.
+    """
+    __slots__ = ('children', 'st_ino', 'mtime', 'listing')
+
+    st_mode = stat.S_IFDIR | 0o755
+    st_nlink = 2
+    st_dev = 0
+    st_uid = os.getuid()
+    st_gid = os.getgid()
+    st_size = 0
+
+    def __init__(self, inode: int, mtime: int = 0, children: dict = None):
+        self.children = {} if children is None else children
+        self.st_ino = inode
+        self.mtime = mtime
+        self.listing = None
+
+    @property
+    def st_mtime(self):
+        return self.mtime or MOUNT_TIME
+
+    st_atime = st_ctime = st_mtime
+
+    def copy(self):
+        return DirectoryNode(self.st_ino, self.mtime, dict(self.children))
+
+    def list(self):
+        # shared directories are never modified, only copied, so a listing stays valid once built
+        listing = self.listing
+        if listing is None:
+            listing = sorted(self.children)
+            self.listing = listing
+        return listing
+
 class VirtualFileSystem:
-    def __init__(self, files_list):
-        self.files = files_list
-        self.structure = self._build_structure()
-        self.file_map = self._build_file_map()
-
-    def _build_structure(self):
-        structure = {
-            '/': ['movies', 'series'],
-            '/movies': set(),
-            '/series': set()
-        }
-        
-        
-        for f in self.files:
-            media_type = f.get('metadata_mediatype')
-            root_folder = f.get('metadata_rootfoldername')
-            
-            if media_type == 'movie':
-                path = f'/movies/{root_folder}'
-                structure['/movies'].add(root_folder)
-                
-                if path not in structure:
-                    structure[path] = set()
-                structure[path].add(f.get('metadata_filename'))
-                
-            elif media_type == 'series':
-                path = f'/series/{root_folder}'
-                structure['/series'].add(root_folder)
-                
-                if path not in structure:
-                    structure[path] = set()
-                structure[path].add(f.get('metadata_foldername'))
-                
-                season_path = f'{path}/{f.get("metadata_foldername")}'
-                if season_path not in structure:
-                    structure[season_path] = set()
-                structure[season_path].add(f.get('metadata_filename'))
-        
-        # consistent ordering
-        for key in structure:
-            structure[key] = sorted([item for item in structure[key] if item is not None])
-            
-        return structure
+    """
+    The tree of directories and files shown in the mount.
 
-    def _build_file_map(self):
-        file_map = {}
-        
-        for f in self.files:
-            if f.get('metadata_mediatype') == 'movie':
-                path = f'/movies/{f.get("metadata_rootfoldername")}/{f.get("metadata_filename")}'
-                file_map[path] = f
-            else:  # series
-                path = f'/series/{f.get("metadata_rootfoldername")}/{f.get("metadata_foldername")}/{f.get("metadata_filename")}'
-                file_map[path] = f
-                
-        return file_map
+    A VFS is never modified once it is in use, apply returns a new one that shares every
+    directory and file it didn't have to change. Directories are also indexed by path, so a
+    file is found with two lookups instead of a walk from the root.
+    """
+    def __init__(self, files_list=()):
+        self.root = DirectoryNode(getInode('/'))
+        self.root.children['movies'] = DirectoryNode(getInode('/movies'))
+        self.root.children['series'] = DirectoryNode(getInode('/series'))
+        self.directories = {'/': self.root, '/movies': self.root.children['movies'], '/series': self.root.children['series']}
+        # files of other media types, reachable by path but not listed
+        self.unlisted = {}
+        self.changed_paths = set()
+        for f in files_list:
+            self._add(f, None)
+
+    def _walk(self, names, copied, create):
+        """
+        Returns the directories from the root down to the one at names, or None if it doesn't exist and create is False.
+
+        When copied is a set, directories not in it are copied before they are returned so they can
+        be modified without touching other VFS views, and the copies are added to it.
+        """
+        node = self.root
+        chain = [node]
+        path = ''
+        for name in names:
+            path = f'{path}/{name}'
+            child = node.children.get(name)
+            if child is None:
+                if not create:
+                    return None
+                child = DirectoryNode(getInode(path))
+                node.children[name] = child
+                self.directories[path] = child
+                if copied is not None:
+                    copied.add(id(child))
+            elif not isinstance(child, DirectoryNode):
+                return None
+            elif copied is not None and id(child) not in copied:
+                child = child.copy()
+                node.children[name] = child
+                self.directories[path] = child
+                copied.add(id(child))
+            chain.append(child)
+            node = child
+        return chain
+
+    def _add(self, f, copied):
+        node = FileNode(f)
+        if not isFileListed(f):
+            self.unlisted[getFilePath(f)] = node
+            return node
+        components = getFileComponents(f)
+        chain = self._walk(components[:-1], copied, create=True)
+        if chain is None:
+            # a file already uses the name of one of the folders
+            return None
+        chain[-1].children[components[-1]] = node
+        for directory in chain:
+            directory.mtime = max(directory.mtime, node.mtime)
+        return node
+
+    def _remove(self, key, path, copied, now):
+        node = self.unlisted.get(path)
+        if node is not None and node.key == key:
+            del self.unlisted[path]
+            return
+        components = path[1:].split('/')
+        chain = self._walk(components[:-1], copied, create=False)
+        if chain is None:
+            return
+        node = chain[-1].children.get(components[-1])
+        if not isinstance(node, FileNode) or node.key != key:
+            # another file took over the path, it isn't ours to remove
+            return
+        del chain[-1].children[components[-1]]
+        chain[-1].mtime = now
+        # drop the folders this file leaves empty, movies and series always stay
+        for depth in range(len(chain) - 1, 1, -1):
+            if chain[depth].children:
+                break
+            del chain[depth - 1].children[components[depth - 1]]
+            del self.directories['/' + '/'.join(components[:depth])]
+            chain[depth - 1].mtime = now
+
+    def apply(self, files_list, added, removed):
+        """
+        Returns a new VFS for files_list built from this one by taking out removed and putting in added.
+
+        removed holds the key and path of each file to take out, as returned by find_files.
+
+        Only the directories on the paths of the changes are copied, everything else is shared with
+        this VFS, which is left as it is so readers still holding it keep a consistent view. When
+        most of the library changed a full build is cheaper and is done instead.
+        """
+        if len(added) + len(removed) > len(files_list) // 2:
+            vfs = VirtualFileSystem(files_list)
+            vfs.changed_paths = vfs.changed_files(self)
+            return vfs
+
+        vfs = VirtualFileSystem.__new__(VirtualFileSystem)
+        vfs.root = self.root.copy()
+        vfs.directories = dict(self.directories)
+        vfs.directories['/'] = vfs.root
+        vfs.unlisted = dict(self.unlisted)
+        vfs.changed_paths = set()
+        copied = {id(vfs.root)}
+        now = int(time.time())
+
+        for key, path in removed:
+            vfs._remove(key, path, copied, now)
+        for f in added:
+            node = vfs._add(f, copied)
+            if node is None:
+                continue
+            path = getFilePath(f)
+            old = self.get_file(path)
+            if old is not None and (old.key != node.key or old.size != node.size):
+                vfs.changed_paths.add(path)
+
+        return vfs
+
+    def _lookup(self, path):
+        parent, _, name = path.rpartition('/')
+        directory = self.directories.get(parent or '/')
+        if directory is not None:
+            node = directory.children.get(name) if name else directory
+            if node is not None:
+                return node
+        return self.unlisted.get(path)
+
+    def iter_files(self):
+        """
+        Yields the path and node of every file.
+        """
+        stack = [('', self.root)]
+        while stack:
+            path, directory = stack.pop()
+            for name, node in directory.children.items():
+                if isinstance(node, DirectoryNode):
+                    stack.append((f'{path}/{name}', node))
+                else:
+                    yield f'{path}/{name}', node
+        yield from self.unlisted.items()
+
+    def find_files(self, keys):
+        """
+        Returns the key and path of every file whose key is in keys.
+        """
+        keys = set(keys)
+        if not keys:
+            return []
+        return [(node.key, path) for path, node in self.iter_files() if node.key in keys]
+
+    def changed_files(self, previous):
+        """
+        Returns the paths that point at a different file than in the previous VFS.
+        """
+        changed = set()
+        for path, node in self.iter_files():
+            old = previous.get_file(path)
+            if old is not None and (old.key != node.key or old.size != node.size):
+                changed.add(path)
+        return changed
 
     def is_dir(self, path):
-        return path in self.structure
+        return type(self._lookup(path)) is DirectoryNode
         
     def is_file(self, path):
-        return path in self.file_map
+        return type(self._lookup(path)) is FileNode
         
     def get_file(self, path):
-        return self.file_map.get(path)
+        node = self._lookup(path)
+        return node if type(node) is FileNode else None
         
     def list_dir(self, path):
-        return self.structure.get(path, [])
-    
+        node = self._lookup(path)
+        return node.list() if type(node) is DirectoryNode else []
 
+    def get_stat(self, path):
+        # nodes carry their own stat fields
+        return self._lookup(path)
 
-    
-class FuseStat(fuse.Stat):
-    def __init__(self):
-        self.st_mode = 0
-        self.st_ino = 0
-        self.st_dev = 0
-        self.st_nlink = 0
-        self.st_uid = 0
-        self.st_gid = 0
-        self.st_size = 0
-        self.st_atime = 0
-        self.st_mtime = 0
-        self.st_ctime = 0
+class FileHandle:
+    """
+    State of a single open file, returned from open and passed back to read and release by fuse-python.
+
+    fuse-python applies keep_cache and direct_io to the opened file. The handle keeps the file
+    node resolved at open, so a refresh of the VFS doesn't change a file while it is being read.
+    """
+    def __init__(self, number, path, file, keep_cache=False, direct_io=False):
+        self.number = number
+        self.path = path
+        self.file = file
+        self.keep_cache = keep_cache
+        self.direct_io = direct_io
+        self.download_link = None
+        self.link_checked = 0
+        self.readahead = None
+        self.stream = RangeStream()
+        self.closed = False
+        self.opened = time.monotonic()
+        self.reads = 0
+        self.bytes_read = 0
 
 class TorBoxMediaCenterFuse(Fuse):
     def __init__(self, *args, **kwargs):
         super(TorBoxMediaCenterFuse, self).__init__(*args, **kwargs)
 
-        threading.Thread(target=self.getFiles, daemon=True).start()
-
-        self.files = []
-        self.vfs = VirtualFileSystem(self.files)
+        # self.vfs is only ever replaced as a whole, operations read it once and use that view throughout
+        # fingerprints of the files in the VFS by file cache key, the records themselves aren't kept
+        self.file_index = {}
+        self.vfs = VirtualFileSystem()
         self.file_handles = {}
+        self.file_handles_lock = threading.Lock()
         self.next_handle = 1
-        self.cached_links = {}
+        self.changed_paths = set()
+        self.changed_paths_lock = threading.Lock()
+
+        # unit of the block cache, fetches cover one or more blocks depending on how a file is read
+        self.block_size = 1024 * 1024
+        disk_cache = None
+        if FUSE_DISK_CACHE_PATH:
+            disk_cache = DiskCache(FUSE_DISK_CACHE_PATH, FUSE_DISK_CACHE_SIZE * 1024 * 1024, self.block_size)
+        self.cache = BlockCache(FUSE_CACHE_SIZE * 1024 * 1024, FUSE_CACHE_FILE_SIZE * 1024 * 1024, disk=disk_cache)
+        self.probe_cache = ProbeCache(FUSE_PROBE_CACHE_SIZE * 1024 * 1024, FUSE_PROBE_HEAD_SIZE * 1024, FUSE_PROBE_TAIL_SIZE * 1024, FUSE_PROBE_BLOCK_SIZE * 1024, disk=disk_cache)
+        self.probe_fetches = SingleFlight()
+        self.probe_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="probe")
+        self.partial_blocks = {}
+        self.partial_blocks_lock = threading.Lock()
+        self.readahead_executor = ThreadPoolExecutor(max_workers=FUSE_READAHEAD_WORKERS, thread_name_prefix="readahead")
+        self.fetch_executor = ThreadPoolExecutor(max_workers=FUSE_READAHEAD_WORKERS, thread_name_prefix="fetch")
+        self.cached_links = LinkCache(getDownloadLink, FUSE_LINK_TTL * 60, self.readahead_executor)
 
-        self.cache = {}
-        self.block_size = 1024 * 1024 * 16
-        self.max_blocks = 16
+        threading.Thread(target=self.getFiles, daemon=True).start()
 
     def getFiles(self):
-        prev_files = []
         while True:
-            files = getAllUserDownloads()
-            if files:
-                self.files = files
-                self.vfs = VirtualFileSystem(self.files)
-                logging.info(f"Updated {len(self.files)} files in VFS")
-                if SYMLINK_PATH:
-                    try:
-                        get_symlink_data = getAllData('symlinks')[0]
-                    except:
-                        get_symlink_data = []
-                    # logging.debug(f"Symlink db:\n{get_symlink_data}")
-                    for file_item in files:
-                        symlink_record = file_item
-                        if file_item.get('metadata_mediatype') == 'movie':
-                            path_tail = f"movies/{file_item.get('metadata_rootfoldername')}/{file_item.get('metadata_filename')}"
-                        else:
-                            path_tail = f"series/{file_item.get('metadata_rootfoldername')}/{file_item.get('metadata_foldername')}/{file_item.get('metadata_filename')}"
-                        v_path = f"{MOUNT_PATH}/{path_tail}"
-                        s_path = f"{SYMLINK_PATH}/{path_tail}"
-                        symlink_record['real_path'] = v_path
-                        symlink_record['symlink_path'] = s_path
-                        if isinstance(get_symlink_data,list) and len(get_symlink_data) > 0:
-                            exists = any(d.get("symlink_path",None) == s_path for d in get_symlink_data)
-                        else:
-                            exists = False
-                        if exists == False or SYMLINK_CREATION == 'always':
-                            logging.debug(f"Attempting to symlink {v_path} to {s_path}")
-                            create_symlink_in_symlink_path(v_path, s_path)
-                            insertData(symlink_record,'symlinks')
-                        else:
-                            logging.debug(f"Symlink {s_path} created previously and creation set to '{SYMLINK_CREATION}'. Skipping")
-                            
-                    logging.info(f"Updated {len(files)} symlinks")
-                deleted_files = list({doc.get('item_id') for doc in prev_files} - {doc.get('item_id') for doc in files})
-                if deleted_files and SYMLINK_PATH:
-                    for file_item in deleted_files:
-                        symlink_record = file_item
-                        if file_item.get('metadata_mediatype') == 'movie':
-                            s_path = f"{SYMLINK_PATH}/movies/{file_item.get('metadata_rootfoldername')}/{file_item.get('metadata_filename')}"
-                        else:
-                            s_path = f"{SYMLINK_PATH}/series/{file_item.get('metadata_rootfoldername')}/{file_item.get('metadata_foldername')}/{file_item.get('metadata_filename')}"
-                        symlink_record['symlink_path'] = s_path
-                        deleteData(symlink_record,'symlinks')
-                        if os.path.islink(s_path):
-                            try:
-                                os.unlink(s_path)
-                                logging.debug(f"Removed symlink {s_path}")
-                            except Exception as e:
-                                logging.error(f"Cannot remove symlink {s_path}: {e}")
-                                pass
-                        else:
-                            logging.debug(f"Symlink {s_path} does not exist")
-                    logging.info(f"Removed {len(deleted_files)} broken or dead symlinks")
-
-            prev_files = files
+            self.refreshFiles()
+            self.cache.flush()
+            cache_stats = self.cache.stats()
+            logging.info(f"Block cache: {cache_stats['size'] / (1024 * 1024):.1f}/{cache_stats['max_size'] / (1024 * 1024):.0f} MB across {cache_stats['files']} files, {cache_stats['hits']} hits, {cache_stats['misses']} misses ({cache_stats['hit_rate']:.1%} hit rate), {cache_stats['evictions']} evictions")
+            link_stats = self.cached_links.stats()
+            logging.debug(f"Coalesced {self.cached_links.flights.shared} link resolutions")
+            logging.debug(f"Download links: {link_stats['links']} cached, {link_stats['refreshes']} refreshed, {link_stats['invalidations']} rejected, {link_stats['failures']} failed to resolve")
+            probe_stats = self.probe_cache.stats()
+            logging.info(f"Probe cache: {probe_stats['size'] / (1024 * 1024):.1f}/{probe_stats['max_size'] / (1024 * 1024):.0f} MB across {probe_stats['files']} files, {probe_stats['hits']} hits, {probe_stats['misses']} misses ({probe_stats['hit_rate']:.1%} hit rate), {probe_stats['evictions']} evictions")
+            if 'disk' in cache_stats:
+                disk_stats = cache_stats['disk']
+                logging.info(f"Disk cache: {disk_stats['size'] / (1024 * 1024):.1f}/{disk_stats['max_size'] / (1024 * 1024):.0f} MB in {disk_stats['blocks']} blocks, {disk_stats['hits']} hits, {disk_stats['misses']} misses ({disk_stats['hit_rate']:.1%} hit rate), {disk_stats['evictions']} evictions, {disk_stats['dropped']} writes dropped")
             logging.debug(f"Waiting 5mins before querying Torbox again for changes")
             time.sleep(300)
+
+    def refreshFiles(self):
+        """
+        Loads the files from the database and brings the VFS and symlinks up to date with them.
+
+        The records are only used during the refresh, once it returns only the VFS and the file index remain.
+        """
+        files = getAllUserDownloads()
+        if not files:
+            return
+        added, removed_keys, file_index = diffFiles(self.file_index, files)
+        removed = self.vfs.find_files(removed_keys)
+        if added or removed_keys:
+            vfs = self.vfs.apply(files, added, removed)
+            with self.changed_paths_lock:
+                self.changed_paths.update(vfs.changed_paths)
+            self.file_index = file_index
+            self.vfs = vfs
+            if vfs.changed_paths:
+                logging.debug(f"{len(vfs.changed_paths)} paths point at different files, their kernel cache is dropped on next open")
+            if FUSE_PROBE_WARM and FUSE_PROBE_CACHE_SIZE > 0:
+                nodes = [vfs.get_file(getFilePath(f)) for f in added]
+                self.probe_executor.submit(self.warmProbeCache, [node for node in nodes if node is not None])
+            logging.info(f"Updated VFS with {len(added)} added and {len(removed_keys)} removed files, {len(files)} files in total")
+        else:
+            logging.info(f"No changes to the {len(files)} files in VFS")
+        if SYMLINK_PATH:
+            try:
+                get_symlink_data = getAllData('symlinks')[0]
+            except:
+                get_symlink_data = []
+            symlink_paths = {d.get("symlink_path",None) for d in get_symlink_data or []}
+            # logging.debug(f"Symlink db:\n{get_symlink_data}")
+            for file_item in files:
+                symlink_record = file_item
+                path_tail = getFilePath(file_item).lstrip('/')
+                v_path = f"{MOUNT_PATH}/{path_tail}"
+                s_path = f"{SYMLINK_PATH}/{path_tail}"
+                symlink_record['real_path'] = v_path
+                symlink_record['symlink_path'] = s_path
+                exists = s_path in symlink_paths
+                if exists == False or SYMLINK_CREATION == 'always':
+                    logging.debug(f"Attempting to symlink {v_path} to {s_path}")
+                    create_symlink_in_symlink_path(v_path, s_path)
+                    insertData(symlink_record,'symlinks')
+                else:
+                    logging.debug(f"Symlink {s_path} created previously and creation set to '{SYMLINK_CREATION}'. Skipping")
+                    
+            logging.info(f"Updated {len(files)} symlinks")
+        # files that changed in place keep their path and symlink
+        added_paths = {getFilePath(f) for f in added}
+        deleted_paths = [path for _, path in removed if path not in added_paths]
+        if deleted_paths and SYMLINK_PATH:
+            for path in deleted_paths:
+                s_path = f"{SYMLINK_PATH}{path}"
+                # other files of the same download keep their symlinks
+                deleteDataByField('symlink_path', s_path, 'symlinks')
+                if os.path.islink(s_path):
+                    try:
+                        os.unlink(s_path)
+                        logging.debug(f"Removed symlink {s_path}")
+                    except Exception as e:
+                        logging.error(f"Cannot remove symlink {s_path}: {e}")
+                        pass
+                else:
+                    logging.debug(f"Symlink {s_path} does not exist")
+            logging.info(f"Removed {len(deleted_paths)} broken or dead symlinks")
+        if SYMLINK_PATH:
+            flushDatabase('symlinks')
         
     def getattr(self, path):
-        st = FuseStat()
-        now = int(time.time())
-        st.st_atime = now
-        st.st_mtime = now
-        st.st_ctime = now
-        
-        st.st_uid = os.getuid()
-        st.st_gid = os.getgid()
-        
-        if self.vfs.is_dir(path):
-            st.st_mode = stat.S_IFDIR | 0o755
-            st.st_nlink = 2
-            return st
-        elif self.vfs.is_file(path):
-            file_info = self.vfs.get_file(path)
-            st.st_mode = stat.S_IFREG | 0o444
-            st.st_nlink = 1
-            st.st_size = file_info.get('file_size', 0)
-            return st
-            
-        # Not found
-        return -errno.ENOENT
+        st = self.vfs.get_stat(path)
+        if st is None:
+            return -errno.ENOENT
+        return st
     
     def readdir(self, path, _):
-        if not self.vfs.is_dir(path):
+        vfs = self.vfs
+        if not vfs.is_dir(path):
             return -errno.ENOENT
             
         yield fuse.Direntry('.')
         yield fuse.Direntry('..')
         
-        for item in self.vfs.list_dir(path):
+        for item in vfs.list_dir(path):
             yield fuse.Direntry(item)
     
-    def open(self, _, flags):
+    def open(self, path, flags):
         accmode = os.O_RDONLY | os.O_WRONLY | os.O_RDWR
         if (flags & accmode) != os.O_RDONLY:
             return -errno.EACCES
+        file = self.vfs.get_file(path)
+        if file is None:
+            return -errno.ENOENT
+        with self.changed_paths_lock:
+            changed = path in self.changed_paths
+            self.changed_paths.discard(path)
+        with self.file_handles_lock:
+            handle = FileHandle(self.next_handle, path, file, keep_cache=FUSE_KERNEL_CACHE and not changed)
+            self.file_handles[handle.number] = handle
+            self.next_handle += 1
+        handle.readahead = ReadAhead(
+            fetch_extent=lambda block_index, block_count: self._startExtent(handle, block_index, block_count, inline=True),
+            block_count=(file.size + self.block_size - 1) // self.block_size,
+            executor=self.readahead_executor,
+            max_window=FUSE_READAHEAD_BLOCKS,
+            is_cached=lambda block_index: (file.key, block_index) in self.cache or (file.key, block_index) in self.partial_blocks,
+            max_stream_blocks=FUSE_STREAM_FETCH_SIZE * 1024 * 1024 // self.block_size,
+            max_ahead_blocks=self.cache.max_file_bytes // self.block_size // 2,
+        )
+        return handle
     
-    def read(self, path, size, offset):
+    def _startExtent(self, handle, start_block, block_count, inline=False):
+        """
+        Returns the in-flight download of start_block, starting a download of up to block_count blocks from it if there is none.
+
+        The extent stops early at a block that is already cached or being downloaded. Concurrent
+        readers of the same block share one download. With inline the download runs in the
+        calling thread, otherwise it runs in the background so readers can be answered as soon
+        as the bytes they asked for have arrived.
+        """
+        file = handle.file
+        file_key = file.key
+        last_block = (file.size - 1) // self.block_size
+        partials = []
+        with self.partial_blocks_lock:
+            partial = self.partial_blocks.get((file_key, start_block))
+            if partial is not None:
+                return partial
+            for block_index in range(start_block, min(start_block + block_count, last_block + 1)):
+                key = (file_key, block_index)
+                if block_index != start_block and (key in self.partial_blocks or key in self.cache):
+                    break
+                partial = PartialBlock()
+                self.partial_blocks[key] = partial
+                partials.append((block_index, partial))
+        first = partials[0][1]
+        if inline:
+            self._fillExtent(handle, partials)
+        else:
+            self.fetch_executor.submit(self._fillExtent, handle, partials)
+        return first
+
+    def _fillExtent(self, handle, partials):
+        path = handle.path
+        file = handle.file
+        file_key = file.key
+        # blocks are taken off the front below, the caller still holds the list
+        partials = list(partials)
+        # blocks at the start may have finished downloading while this extent was queued
+        while partials:
+            block_index, partial = partials[0]
+            block_data = self.cache.get((file_key, block_index)) if (file_key, block_index) in self.cache else None
+            if block_data is None:
+                break
+            partial.append(block_data)
+            self._finishBlock(file_key, block_index, partial)
+            partials.pop(0)
+        if not partials:
+            return
+
+        extent_offset = partials[0][0] * self.block_size
+        extent_length = min(len(partials) * self.block_size, file.size - extent_offset)
+        logging.debug(f"Fetching {extent_length} bytes of {path} from block {partials[0][0]}")
+
+        def download(download_link):
+            # resume where a rejected attempt stopped
+            position = sum(len(partial.data) for _, partial in partials)
+            for chunk in self._iterRange(handle, download_link, extent_offset + position, extent_length - position):
+                while chunk:
+                    block_index, partial = partials[position // self.block_size]
+                    piece = chunk[:self.block_size - position % self.block_size]
+                    chunk = chunk[len(piece):]
+                    partial.append(piece)
+                    position += len(piece)
+                    if position % self.block_size == 0 or position == extent_length:
+                        self.cache.put((file_key, block_index), bytes(partial.data))
+                        self._finishBlock(file_key, block_index, partial)
+
+        try:
+            self._withDownloadLink(file, download, handle)
+        except Exception as e:
+            logging.error(f"Error downloading blocks {partials[0][0]}-{partials[-1][0]} of {path}: {e}")
+            for block_index, partial in partials:
+                if not partial.done:
+                    self._finishBlock(file_key, block_index, partial, e)
+
+    def _finishBlock(self, file_key, block_index, partial, error=None):
+        partial.finish(error)
+        with self.partial_blocks_lock:
+            if self.partial_blocks.get((file_key, block_index)) is partial:
+                del self.partial_blocks[(file_key, block_index)]
+
+    def _withDownloadLink(self, file, download, handle=None):
+        """
+        Calls download with the current download link of a file, resolving the link again and retrying when it is rejected.
+
+        A handle keeps the link it used and only asks the link cache again once the link is due for a refresh.
+        """
+        file_key = file.key
+        for attempt in range(FUSE_LINK_RETRIES + 1):
+            if handle is not None and handle.download_link is not None and time.monotonic() - handle.link_checked < self.cached_links.refresh_after:
+                download_link = handle.download_link
+            else:
+                download_link = self.cached_links.get(file_key, file.download_link)
+                if handle is not None:
+                    handle.download_link = download_link
+                    handle.link_checked = time.monotonic()
+            try:
+                return download(download_link)
+            except DownloadLinkExpired:
+                self.cached_links.invalidate(file_key, download_link)
+                if handle is not None:
+                    handle.download_link = None
+                if attempt == FUSE_LINK_RETRIES:
+                    raise
+                logging.info(f"Download link for {file.key} is no longer valid, resolving it again...")
+                time.sleep(0.5 * 2 ** attempt)
+
+    def _fetchProbeBlock(self, file, block_index):
+        file_key = file.key
+        # a fetch for this block may have finished while this one was waiting
+        if (file_key, block_index) in self.probe_cache:
+            data = self.probe_cache.get(file_key, block_index)
+            if data is not None:
+                return data
+        block_offset = block_index * self.probe_cache.block_size
+        block_length = min(self.probe_cache.block_size, file.size - block_offset)
+        data = self._withDownloadLink(file, lambda download_link: b''.join(streamFile(download_link, block_length, block_offset)))
+        self.probe_cache.put(file_key, block_index, data)
+        return data
+
+    def _readProbe(self, file, offset, end):
+        """
+        Reads a range from the head or tail of a file through the probe cache.
+
+        Returns None when the range is better served from a block that is already in the block cache.
+        """
+        file_key = file.key
+        probe_block_size = self.probe_cache.block_size
+        buffer = bytearray()
+        for block_index in self.probe_cache.blocks(offset, end):
+            block_offset = block_index * probe_block_size
+            data = self.probe_cache.get(file_key, block_index)
+            if data is None:
+                if (file_key, block_offset // self.block_size) in self.cache:
+                    return None
+                data = self.probe_fetches.do((file_key, block_index), self._fetchProbeBlock, file, block_index)
+            buffer.extend(data[max(0, offset - block_offset):end - block_offset])
+        return bytes(buffer)
+
+    def warmProbeCache(self, files):
+        """
+        Fetches the first and last probe block of every file that is not cached yet, while the probe cache has room.
+        """
+        warmed = 0
+        for file in files:
+            file_size = file.size
+            if file_size <= 0:
+                continue
+            file_key = file.key
+            for block_index in {0, (file_size - 1) // self.probe_cache.block_size}:
+                if (file_key, block_index) in self.probe_cache:
+                    continue
+                if not self.probe_cache.has_room(self.probe_cache.block_size):
+                    logging.info(f"Probe cache is full, warmed {warmed} blocks")
+                    return
+                try:
+                    self.probe_fetches.do((file_key, block_index), self._fetchProbeBlock, file, block_index)
+                    warmed += 1
+                except Exception as e:
+                    logging.debug(f"Error warming probe cache for {file.key}: {e}")
+        logging.info(f"Warmed {warmed} probe blocks")
+
+    def _iterRange(self, handle, download_link, offset, size):
+        """
+        Yields a range of a file, continuing the open stream of the handle when it is free.
+        """
+        stream = handle.stream
+        if not handle.closed and stream.lock.acquire(blocking=False):
+            try:
+                yield from stream.iter_range(download_link, offset, size)
+            finally:
+                stream.lock.release()
+                # release couldn't close the stream while this download was using it
+                if handle.closed:
+                    stream.close()
+        else:
+            # the stream is busy with another block of this file
+            yield from streamFile(download_link, size, offset)
+
+    def read(self, path, size, offset, fh=None):
         logging.debug(f"READ Path: {path}")
         logging.debug(f"READ Size: {size}")
         logging.debug(f"READ Offset: {offset}")
-        file = self.vfs.get_file(path)
-        
-        if path not in self.cached_links:
-            self.cached_links[path] = getDownloadLink(file.get('download_link'))
-        download_link = self.cached_links[path]
+        handle = fh
+        if handle is None:
+            # serve reads without a handle from open on a handle of their own
+            handle = self.open(path, os.O_RDONLY)
+            if not isinstance(handle, FileHandle):
+                return handle
+            try:
+                return self.read(path, size, offset, handle)
+            finally:
+                self.release(path, os.O_RDONLY, handle)
+        file = handle.file
+        if offset >= file.size:
+            return b''
+        handle.reads += 1
         
+        read_end = min(offset + size, file.size)
         start_block = offset // self.block_size
-        end_block = (offset + size - 1) // self.block_size
+        end_block = (read_end - 1) // self.block_size
+
+        file_key = file.key
+        readahead = handle.readahead
+        readahead.on_read(start_block, end_block)
+
+        # probes of the start and end of a file only fetch small blocks
+        if self.probe_cache.covers(file.size, offset, read_end):
+            try:
+                data = self._readProbe(file, offset, read_end)
+            except Exception as e:
+                logging.error(f"Error reading probe range {offset}-{read_end} of {path}: {e}")
+                return -errno.EIO
+            if data is not None:
+                handle.bytes_read += len(data)
+                return data
         
         buffer = bytearray()
         
         for block_index in range(start_block, end_block + 1):
             block_offset = block_index * self.block_size
-            block_end = min((block_index + 1) * self.block_size - 1, file.get('file_size') - 1)
-            current_block_size = block_end - block_offset + 1
+            start_offset_in_block = max(0, offset - block_offset)
+            end_offset_in_block = min(self.block_size, file.size - block_offset, offset + size - block_offset)
             
             # check for block
-            if (path, block_index) not in self.cache:
+            block_data = self.cache.get((file_key, block_index))
+            if block_data is None:
                 logging.debug(f"Cache miss for block {block_index}, fetching...")
-                # get block
-                block_data = downloadFile(download_link, current_block_size, block_offset)
-                if not block_data:
+                partial = self._startExtent(handle, block_index, readahead.fetch_blocks())
+                try:
+                    buffer.extend(partial.read(start_offset_in_block, end_offset_in_block))
+                except Exception as e:
+                    logging.error(f"Error reading block {block_index} of {path}: {e}")
                     return -errno.EIO
-                # save block to cache
-                self.cache[(path, block_index)] = block_data
-                # lru cache
-                if len(self.cache) > self.max_blocks * len(self.cached_links):
-                    keys_to_remove = list(self.cache.keys())[:len(self.cache) - self.max_blocks]
-                    for key in keys_to_remove:
-                        del self.cache[key]
-            # get block from cache
-            block_data = self.cache[(path, block_index)]
-            
-            start_offset_in_block = max(0, offset - block_offset)
-            end_offset_in_block = min(len(block_data), offset + size - block_offset)
+                continue
             
             buffer.extend(block_data[start_offset_in_block:end_offset_in_block])
         
+        handle.bytes_read += len(buffer)
         return bytes(buffer)
     
-    def release(self, _, fh):
-        if fh in self.file_handles:
-            del self.file_handles[fh]
+    def release(self, path, flags, fh=None):
+        handle = fh
+        if not isinstance(handle, FileHandle):
+            return 0
+        handle.closed = True
+        handle.readahead.cancel()
+        # a download still using the stream closes it when it finishes
+        if not handle.stream.lock.locked():
+            handle.stream.close()
+        with self.file_handles_lock:
+            self.file_handles.pop(handle.number, None)
+        readahead_stats = handle.readahead.stats()
+        logging.debug(f"Closed {path} after {handle.reads} reads of {handle.bytes_read / (1024 * 1024):.1f} MB in {time.monotonic() - handle.opened:.1f}s, {readahead_stats['seeks']} seeks, last read as {readahead_stats['mode']} with {readahead_stats['fetch_blocks'] * self.block_size // (1024 * 1024)} MB fetches")
         return 0
     
 def runFuse():
@@ -297,7 +817,18 @@ def runFuse():
     server.fuse_args.add(
         "-f"
     )
+    server.fuse_args.add(
+        "use_ino"
+    )
+    server.fuse_args.add(
+        f"attr_timeout={FUSE_ATTR_TIMEOUT}"
+    )
+    server.fuse_args.add(
+        f"entry_timeout={FUSE_ENTRY_TIMEOUT}"
+    )
     server.parse(values=server, errex=1)
+    server.multithreaded = FUSE_MULTITHREADED
+    logging.info(f"Serving FUSE requests {'concurrently' if FUSE_MULTITHREADED else 'one at a time'}")
     try:
         server.fuse_args.mountpoint = MOUNT_PATH
     except OSError as e:
@@ -1,4 +1,5 @@
 import re
+import sys
 
 def constructSeriesTitle(season = None, episode = None, folder: bool = False):
     """
@@ -54,3 +55,20 @@ def cleanYear(year: str | int):
         year = year.split("-")[0]
     if year and year != "None":
         return int(year)
+
+def getFileComponents(file: dict):
+    """
+    Returns the names along the path of a file inside the mount, files that aren't movies are placed under series.
+    """
+    if file.get('metadata_mediatype') == 'movie':
+        components = ('movies', file.get('metadata_rootfoldername'), file.get('metadata_filename'))
+    else:
+        components = ('series', file.get('metadata_rootfoldername'), file.get('metadata_foldername'), file.get('metadata_filename'))
+    # the same folder names repeat across thousands of files, interning keeps one copy of each
+    return [sys.intern(str(name)) for name in components[:-1]] + [str(components[-1])]
+
+def getFilePath(file: dict):
+    """
+    Returns the path of a file inside the mount.
+    """
+    return '/' + '/'.join(getFileComponents(file))
@@ -0,0 +1,124 @@
+import threading
+import logging
+
+PROBING = "probing"
+SEEKING = "seeking"
+STREAMING = "streaming"
+
+class ReadAhead:
+    """
+    Access pattern tracking and read-ahead for a single open file.
+
+    Every read reports the blocks it touched and the file is classified as probing (its first
+    reads), seeking (jumping around) or streaming (reading forward). The mode decides how many
+    blocks one fetch covers: probes and seeks fetch small extents, streams fetch extents that
+    grow up to max_stream_blocks. While streaming, the window of prefetched extents doubles up
+    to max_window but never reaches further than max_ahead_blocks past the reader, a seek
+    cancels prefetches not yet started and resets the window.
+    """
+    def __init__(self, fetch_extent, block_count: int, executor, max_window: int, is_cached, probe_blocks: int = 1, seek_blocks: int = 4, stream_blocks: int = 8, max_stream_blocks: int = 64, max_ahead_blocks: int = 64, streaming_after: int = 4):
+        self.fetch_extent = fetch_extent
+        self.block_count = block_count
+        self.executor = executor
+        self.max_window = max_window
+        self.is_cached = is_cached
+        self.probe_blocks = probe_blocks
+        self.seek_blocks = seek_blocks
+        self.stream_blocks = min(stream_blocks, max_stream_blocks)
+        self.max_stream_blocks = max_stream_blocks
+        self.max_ahead_blocks = max_ahead_blocks
+        self.streaming_after = streaming_after
+        self.mode = PROBING
+        self.stream_fetch_blocks = self.stream_blocks
+        self.streak = 0
+        self.window = 0
+        self.last_block = None
+        self.pending = {}
+        self.scheduled_until = 0
+        self.reads = 0
+        self.seeks = 0
+        self.lock = threading.RLock()
+
+    def fetch_blocks(self):
+        """
+        Returns how many blocks a fetch should cover in the current mode.
+        """
+        with self.lock:
+            if self.mode == STREAMING:
+                return self.stream_fetch_blocks
+            if self.mode == SEEKING:
+                return self.seek_blocks
+            return self.probe_blocks
+
+    def on_read(self, start_block: int, end_block: int):
+        """
+        Updates the access pattern with a read covering start_block..end_block and schedules prefetches.
+        """
+        with self.lock:
+            self.reads += 1
+            last_block = self.last_block
+            self.last_block = end_block
+            if last_block is None:
+                return
+            if start_block < last_block or start_block > last_block + 1:
+                logging.debug(f"Seek from block {last_block} to {start_block}, cancelling read-ahead")
+                self.seeks += 1
+                self.mode = SEEKING
+                self.streak = 0
+                self.stream_fetch_blocks = self.stream_blocks
+                self.window = 0
+                self._cancel()
+                return
+
+            self.streak += 1
+            if self.mode != STREAMING:
+                if self.streak < self.streaming_after:
+                    return
+                logging.debug(f"Sequential reads up to block {end_block}, switching to streaming")
+                self.mode = STREAMING
+            elif end_block > last_block:
+                self.stream_fetch_blocks = min(self.stream_fetch_blocks * 2, self.max_stream_blocks)
+            if self.max_window <= 0:
+                return
+            if end_block > last_block or self.window == 0:
+                self.window = min(max(self.window * 2, 1), self.max_window)
+
+            # extents that are queued or running cover everything up to scheduled_until
+            block_index = max(end_block + 1, self.scheduled_until)
+            prefetch_end = min(end_block + 1 + min(self.window * self.stream_fetch_blocks, self.max_ahead_blocks), self.block_count)
+            while block_index < prefetch_end:
+                if block_index in self.pending or self.is_cached(block_index):
+                    block_index += 1
+                    continue
+                block_count = min(self.stream_fetch_blocks, prefetch_end - block_index)
+                future = self.executor.submit(self.fetch_extent, block_index, block_count)
+                self.pending[block_index] = future
+                future.add_done_callback(lambda future, block_index=block_index: self._done(block_index, future))
+                block_index += block_count
+            self.scheduled_until = max(self.scheduled_until, prefetch_end)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "mode": self.mode,
+                "reads": self.reads,
+                "seeks": self.seeks,
+                "fetch_blocks": self.fetch_blocks(),
+                "window": self.window,
+            }
+
+    def cancel(self):
+        with self.lock:
+            self._cancel()
+
+    def _cancel(self):
+        # caller must hold self.lock, running fetches finish and still land in the cache
+        for future in list(self.pending.values()):
+            future.cancel()
+        self.pending.clear()
+        self.scheduled_until = 0
+
+    def _done(self, block_index: int, future):
+        with self.lock:
+            if self.pending.get(block_index) is future:
+                del self.pending[block_index]
@@ -1,8 +1,15 @@
 import os
-from library.filesystem import MOUNT_PATH
+from library.filesystem import MOUNT_PATH, STRM_MANIFEST_PATH, STRM_WRITE_WORKERS, STRM_STAGED
 import logging
 from functions.appFunctions import getAllUserDownloads
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
 import shutil
+import time
+
+# folder of the mount path the staged generations of the library are built in
+STRM_GENERATIONS_FOLDER = ".generations"
 
 def generateFolderPath(data: dict):
     """
@@ -40,20 +47,288 @@ def generateFolderPath(data: dict):
         )
     return folder_path
 
-def generateStremFile(file_path: str, url: str, type: str, file_name: str):
-    if file_path is None:
-        return
+def getStremFolder(type: str):
+    """
+    Returns the folder of the mount path a media type is placed in.
+    """
     if type == "movie":
-        type = "movies"
+        return "movies"
     elif type == "series":
-        type = "series"
+        return "series"
     elif type == "anime":
-        type = "series"
+        return "series"
+    return type
+
+def getStremFilePath(data: dict):
+    """
+    Takes in a user download and returns the path of its strm file relative to the mount path, or None if it has none.
+    """
+    file_path = generateFolderPath(data)
+    if file_path is None:
+        return None
+    return os.path.join(getStremFolder(data.get("metadata_mediatype")), file_path, f"{data.get('metadata_filename')}.strm")
+
+def getStremContentHash(url: str):
+    return hashlib.blake2b(str(url).encode(), digest_size=8).hexdigest()
+
+def loadStremManifest():
+    """
+    Returns the strm files written by the last run as relative paths mapped to the hash of their content, or None without a manifest.
+    """
+    try:
+        with open(STRM_MANIFEST_PATH) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.error(f"Error loading strm manifest, checking every strm file: {e}")
+        return None
+
+def saveStremManifest(manifest: dict):
+    with open(f"{STRM_MANIFEST_PATH}.tmp", "w") as file:
+        json.dump(manifest, file)
+    os.replace(f"{STRM_MANIFEST_PATH}.tmp", STRM_MANIFEST_PATH)
+
+def findStremFiles():
+    """
+    Returns the relative paths of all strm files in the mount path.
+    """
+    strm_files = []
+    for folder in ["movies", "series"]:
+        for root, _, files in os.walk(os.path.join(MOUNT_PATH, folder)):
+            for file_name in files:
+                if file_name.endswith(".strm"):
+                    strm_files.append(os.path.relpath(os.path.join(root, file_name), MOUNT_PATH))
+    return strm_files
+
+def removeEmptyFolders(folder: str):
+    """
+    Removes a folder of the mount path and its parents for as long as they are empty, keeping the media type folders.
+    """
+    while os.path.dirname(folder):
+        try:
+            os.rmdir(os.path.join(MOUNT_PATH, folder))
+        except OSError:
+            # not empty or already gone
+            return
+        logging.debug(f"Removed empty folder: {folder}")
+        folder = os.path.dirname(folder)
+
+def isStremFileCurrent(path: str, content_hash: str):
+    try:
+        with open(os.path.join(MOUNT_PATH, path)) as file:
+            return getStremContentHash(file.read()) == content_hash
+    except (OSError, ValueError):
+        # unreadable or not text, either way it is written again
+        return False
+
+def createStremFolder(folder: str):
+    try:
+        os.makedirs(folder, exist_ok=True)
+    except OSError as e:
+        logging.error(f"Error creating strm folder (likely bad or missing permissions): {e}")
+
+def linkStremFile(path: str, root: str):
+    """
+    Hard links the current strm file at path into the generation at root, returning whether it worked.
+    """
+    try:
+        os.link(os.path.join(MOUNT_PATH, path), os.path.join(root, path))
+        return True
+    except OSError as e:
+        logging.debug(f"Cannot link strm file {path}, writing it instead: {e}")
+        return False
+
+def writeStremFile(download: dict, root: str):
+    return generateStremFile(generateFolderPath(download), download.get("download_link"), download.get("metadata_mediatype"), download.get("metadata_filename"), create_folder=False, root=root)
+
+def syncStremFile(path: str, download: dict, content_hash: str, previous_hash, adopting: bool, root: str = MOUNT_PATH):
+    """
+    Writes the strm file of a download whose folder already exists, returning which count it adds to.
+
+    Into a staged generation, files whose content is current are linked from the current generation.
+    """
+    if adopting and previous_hash is None and isStremFileCurrent(path, content_hash):
+        if root == MOUNT_PATH or linkStremFile(path, root) or writeStremFile(download, root):
+            return "unchanged"
+        return "failed"
+    if not writeStremFile(download, root):
+        return "failed"
+    return "updated" if previous_hash is not False else "created"
+
+def carryStremFile(path: str, download: dict, root: str):
+    """
+    Brings an unchanged strm file into a staged generation, returning which count it adds to.
+    """
+    if linkStremFile(path, root) or writeStremFile(download, root):
+        return "unchanged"
+    return "failed"
+
+def removeStremFile(path: str):
+    """
+    Removes a strm file along with the folders it leaves empty, returning whether it is gone.
+    """
+    try:
+        os.remove(os.path.join(MOUNT_PATH, path))
+        logging.debug(f"Removed strm file: {path}")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.error(f"Error removing strm file: {e}")
+        return False
+    removeEmptyFolders(os.path.dirname(path))
+    return True
+
+def runInBatches(executor: ThreadPoolExecutor, function, items: list):
+    """
+    Calls function with every item across the executor and returns the results in order.
+
+    Workers are handed batches of items, a task per file would cost more than writing it on a local disk.
+    """
+    size = max(1, min(64, -(-len(items) // STRM_WRITE_WORKERS)))
+    batches = [items[start:start + size] for start in range(0, len(items), size)]
+    results = []
+    for batch_results in executor.map(lambda batch: [function(item) for item in batch], batches):
+        results.extend(batch_results)
+    return results
+
+def createStremGeneration():
+    """
+    Returns the folder for a new generation of the library, next to the current one.
+    """
+    generation = os.path.join(MOUNT_PATH, STRM_GENERATIONS_FOLDER, str(time.time_ns()))
+    for folder in ["movies", "series"]:
+        os.makedirs(os.path.join(generation, folder), exist_ok=True)
+    return generation
+
+def swapStremGeneration(generation: str):
+    """
+    Points the media type folders of the mount path at a generation and removes the previous ones.
+
+    Each folder is a symlink that is swapped with a single rename, so readers see either the old or the
+    new library in full. Folders of a library written in place are moved aside on the first swap.
+    """
+    generations_path = os.path.join(MOUNT_PATH, STRM_GENERATIONS_FOLDER)
+    for folder in ["movies", "series"]:
+        folder_path = os.path.join(MOUNT_PATH, folder)
+        if os.path.isdir(folder_path) and not os.path.islink(folder_path):
+            os.rename(folder_path, os.path.join(generations_path, f"in-place-{folder}"))
+        temporary_path = f"{folder_path}.swap"
+        if os.path.lexists(temporary_path):
+            os.remove(temporary_path)
+        # relative, so the library resolves wherever the mount path is mounted
+        os.symlink(os.path.relpath(os.path.join(generation, folder), MOUNT_PATH), temporary_path)
+        os.replace(temporary_path, folder_path)
+    for name in os.listdir(generations_path):
+        previous_generation = os.path.join(generations_path, name)
+        if previous_generation != generation:
+            shutil.rmtree(previous_generation, ignore_errors=True)
+            logging.debug(f"Removed strm generation: {previous_generation}")
+
+def reconcileStrm(downloads: list):
+    """
+    Brings the strm files in the mount path in line with the downloads and returns counts of what was done.
+
+    Only new and changed files are written and files of downloads that are gone are removed along with
+    the folders they leave empty. What was written is kept in a manifest, so files are not read or
+    rewritten on later runs, only checked for existence so files deleted outside of the app are written
+    again. Without a manifest, existing files are compared by content and strm files that don't belong
+    to any download are removed.
+
+    The folders of the files to write are created once each, then files are written and removed across
+    STRM_WRITE_WORKERS threads, which hides the latency of network storage.
+
+    With STRM_STAGED, changes are not made in place. A new generation of the whole library is built next
+    to the current one, with unchanged files hard linked from it, and then swapped in.
+    """
+    manifest = loadStremManifest()
+    adopting = manifest is None
+    if adopting:
+        manifest = {path: None for path in findStremFiles()}
+
+    wanted = {}
+    for download in downloads:
+        path = getStremFilePath(download)
+        if path is None:
+            continue
+        wanted[path] = download
+
+    counts = {"created": 0, "updated": 0, "unchanged": 0, "removed": 0, "failed": 0}
+    new_manifest = {}
+    unchanged = []
+    pending = []
+    for path, download in wanted.items():
+        content_hash = getStremContentHash(download.get("download_link"))
+        previous_hash = manifest.get(path, False)
+        if previous_hash == content_hash:
+            unchanged.append((path, download, content_hash))
+            continue
+        pending.append((path, download, content_hash, previous_hash))
+    stale = [path for path in manifest if path not in wanted]
+
+    with ThreadPoolExecutor(max_workers=STRM_WRITE_WORKERS) as executor:
+        # a stat per file is cheap next to writing it, files deleted outside of the app are created again
+        exists = runInBatches(executor, lambda task: os.path.exists(os.path.join(MOUNT_PATH, task[0])), unchanged)
+        pending.extend((path, download, content_hash, False) for (path, download, content_hash), found in zip(unchanged, exists) if not found)
+        unchanged = [task for task, found in zip(unchanged, exists) if found]
 
-    full_path = os.path.join(MOUNT_PATH, type, file_path)
+        staged = STRM_STAGED and bool(pending or stale)
+        if not staged:
+            counts["unchanged"] += len(unchanged)
+            new_manifest.update((path, content_hash) for path, _, content_hash in unchanged)
+            unchanged = []
+
+        if pending or stale:
+            root = createStremGeneration() if staged else MOUNT_PATH
+            # episodes share their season folder, so there are far fewer folders than files
+            folders = sorted({os.path.join(root, os.path.dirname(task[0])) for task in pending + unchanged})
+            runInBatches(executor, createStremFolder, folders)
+            results = runInBatches(executor, lambda task: carryStremFile(task[0], task[1], root), unchanged)
+            for (path, _, content_hash), result in zip(unchanged, results):
+                counts[result] += 1
+                if result != "failed":
+                    new_manifest[path] = content_hash
+            results = runInBatches(executor, lambda task: syncStremFile(*task, adopting, root), pending)
+            for (path, _, content_hash, _), result in zip(pending, results):
+                counts[result] += 1
+                if result != "failed":
+                    new_manifest[path] = content_hash
+            if staged:
+                # stale files are simply left out of the new generation
+                counts["removed"] += len(stale)
+            else:
+                for path, removed in zip(stale, runInBatches(executor, removeStremFile, stale)):
+                    if removed:
+                        counts["removed"] += 1
+                    else:
+                        new_manifest[path] = manifest[path]
+                        counts["failed"] += 1
+        if staged:
+            try:
+                swapStremGeneration(root)
+            except OSError as e:
+                logging.error(f"Error swapping in strm generation, keeping the current library: {e}")
+                shutil.rmtree(root, ignore_errors=True)
+                return counts
+
+    if new_manifest == manifest:
+        return counts
+    try:
+        saveStremManifest(new_manifest)
+    except OSError as e:
+        logging.error(f"Error saving strm manifest: {e}")
+    return counts
+
+def generateStremFile(file_path: str, url: str, type: str, file_name: str, create_folder: bool = True, root: str = MOUNT_PATH):
+    if file_path is None:
+        return
+    type = getStremFolder(type)
+
+    full_path = os.path.join(root, type, file_path)
 
     try:
-        os.makedirs(full_path, exist_ok=True)
+        if create_folder:
+            os.makedirs(full_path, exist_ok=True)
         with open(f"{full_path}/{file_name}.strm", "w") as file:
             file.write(url)
         logging.debug(f"Created strm file: {full_path}/{file_name}.strm")
@@ -70,13 +345,10 @@ def generateStremFile(file_path: str, url: str, type: str, file_name: str):
 
 def runStrm():
     all_downloads = getAllUserDownloads()
-    for download in all_downloads:
-        file_path = generateFolderPath(download)
-        if file_path is None:
-            continue
-        generateStremFile(file_path, download.get("download_link"), download.get("metadata_mediatype"), download.get("metadata_filename"))
+    counts = reconcileStrm(all_downloads)
 
-    logging.debug(f"Updated {len(all_downloads)} strm files.")
+    logging.info(f"Updated strm files: {counts['created']} created, {counts['updated']} updated, {counts['unchanged']} unchanged, {counts['removed']} removed, {counts['failed']} failed")
+    return counts
 
 def unmountStrm():
     """
@@ -92,7 +364,12 @@ def unmountStrm():
             logging.debug(f"Folder {folder} already exists. Deleting...")
             for item in os.listdir(folder):
                 item_path = os.path.join(folder, item)
-                if os.path.isdir(item_path):
+                if os.path.isdir(item_path) and not os.path.islink(item_path):
                     shutil.rmtree(item_path)
                 else:
-                    os.remove(item_path)
\ No newline at end of file
+                    os.remove(item_path)
+    # the files it lists are gone, the next run writes every file again
+    try:
+        os.remove(STRM_MANIFEST_PATH)
+    except FileNotFoundError:
+        pass
\ No newline at end of file
@@ -1,16 +1,42 @@
-from library.http import api_http_client, search_api_http_client, general_http_client
+from library.http import general_http_client, createAsyncApiHttpClient, createAsyncSearchApiHttpClient
 import httpx
 from enum import Enum
 import PTN
 from library.torbox import TORBOX_API_KEY
+from library.app import SYNC_API_CONCURRENCY, SYNC_SEARCH_CONCURRENCY
 from library.filesystem import MOUNT_PATH, SYMLINK_PATH
 from functions.mediaFunctions import constructSeriesTitle, cleanTitle, cleanYear
-from functions.databaseFunctions import insertData
+from functions.databaseFunctions import replaceMultipleData, getAllData, deleteDataByIds
+from functions.cacheFunctions import MetadataCache, getMetadataCacheKey
+from library.metadata import METADATA_CACHE_PATH, METADATA_CACHE_TTL, METADATA_CACHE_MISS_TTL, METADATA_CACHE_ERROR_TTL, METADATA_CACHE_SIZE
 import os
 import logging
 import traceback
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import multiprocessing
+import threading
+import asyncio
+import functools
+import time
+import re
+
+EXPIRED_LINK_STATUS_CODES = [
+    httpx.codes.FORBIDDEN,
+    httpx.codes.NOT_FOUND,
+    httpx.codes.GONE,
+]
+
+# titles PTN leaves for files named only by their episode, like "01", "Ep 01" or "S01"
+EPISODE_CODE_PATTERN = re.compile(r"(s?\d+)?\s*(e|ep|episode|x)?\s*\d+", re.IGNORECASE)
+
+class DownloadLinkExpired(Exception):
+    """Raised when a download link is rejected and needs to be resolved again."""
+
+metadata_cache = MetadataCache(
+    METADATA_CACHE_PATH,
+    METADATA_CACHE_SIZE,
+    ttl=METADATA_CACHE_TTL * 24 * 60 * 60,
+    miss_ttl=METADATA_CACHE_MISS_TTL * 60 * 60,
+    error_ttl=METADATA_CACHE_ERROR_TTL * 60,
+)
 
 class DownloadType(Enum):
     torrent = "torrents"
@@ -27,9 +53,31 @@ ACCEPTABLE_MIME_TYPES = [
     "video/mp4",
 ]
 
-def process_file(item, file, type):
-    """Process a single file and return the processed data"""
-    if not file.get("mimetype").startswith("video/") or file.get("mimetype") not in ACCEPTABLE_MIME_TYPES:
+def isAcceptedFile(file):
+    """Returns whether a file of a download is a video the media center can serve"""
+    mimetype = file.get("mimetype") or ""
+    return mimetype.startswith("video/") and mimetype in ACCEPTABLE_MIME_TYPES
+
+class SyncSession:
+    """
+    Async clients and per endpoint concurrency limits shared by everything a sync runs.
+
+    Has to be created and closed inside the event loop that uses it.
+    """
+    def __init__(self):
+        self.api_client = createAsyncApiHttpClient()
+        self.search_client = createAsyncSearchApiHttpClient()
+        self.mylist_limit = asyncio.Semaphore(SYNC_API_CONCURRENCY)
+        self.search_limit = asyncio.Semaphore(SYNC_SEARCH_CONCURRENCY)
+        self.searches = {}
+
+    async def close(self):
+        await self.api_client.aclose()
+        await self.search_client.aclose()
+
+def parseFile(item, file, type):
+    """Parses the name of a single file and returns its stored data without metadata, its parsed title data, search query and full title"""
+    if not isAcceptedFile(file):
         logging.debug(f"Skipping file {file.get('short_name')} with mimetype {file.get('mimetype')}")
         return None
     
@@ -38,94 +86,305 @@ def process_file(item, file, type):
         "type": type.value,
         "folder_name": item.get("name"),
         "folder_hash": item.get("hash"),
+        "created_at": item.get("created_at"),
         "file_id": file.get("id"),
         "file_name": file.get("short_name"),
         "file_size": file.get("size"),
         "file_mimetype": file.get("mimetype"),
         "path": file.get("name"),
-        "download_link": f"https://api.torbox.app/v1/api/{type.value}/requestdl?token={TORBOX_API_KEY}&{IDType[type.value].value}={item.get('id')}&file_id={file.get('id')}&redirect=true",
+        "download_link": getApiDownloadLink(type.value, item.get("id"), file.get("id")),
         "extension": os.path.splitext(file.get("short_name"))[-1],              
     }
     title_data = PTN.parse(file.get("short_name"))
+    query = title_data.get("title", file.get("short_name"))
 
-    if item.get("name") == item.get("hash"):
-        item["name"] = title_data.get("title", file.get("short_name"))
+    download_name = item.get("name")
+    if isHashName(item):
+        download_name = query
 
-    metadata, _, _ = searchMetadata(title_data.get("title", file.get("short_name")), title_data, file.get("short_name"), f"{item.get('name')} {file.get('short_name')}")
-    data.update(metadata)
-    logging.debug(f"Processing data {data}")
-    insertData(data, type.value)
-    return data
+    return data, title_data, query, f"{download_name} {file.get('short_name')}"
 
-def getUserDownloads(type: DownloadType):
-    offset = 0
-    limit = 1000
+def getApiDownloadLink(type: str, item_id, file_id):
+    """Returns the API link of a file that redirects to its download"""
+    return f"https://api.torbox.app/v1/api/{type}/requestdl?token={TORBOX_API_KEY}&{IDType[type].value}={item_id}&file_id={file_id}&redirect=true"
 
-    file_data = []
-    
+def isHashName(item: dict):
+    """Returns whether a download has no name of its own, downloads added by hash are named after it"""
+    return not item.get("name") or item.get("name") == item.get("hash")
+
+@functools.lru_cache(maxsize=4096)
+def parseDownloadName(name: str):
+    # every file of a download parses the same name
+    return PTN.parse(name)
+
+def getTitleGroupKey(item: dict, query: str, title_data: dict):
+    """
+    Returns the key files are grouped by for a metadata search, the normalized title and year of a file.
+
+    Files named with their own title are grouped by it, so the movies of a collection are searched
+    apart. Episode files are often named without their show (S01E01.mkv), those are grouped by the
+    download they belong to, or kept to themselves when the download is only named after its hash.
+    """
+    title = title_data.get("title")
+    if title and not EPISODE_CODE_PATTERN.fullmatch(title.strip()):
+        return getMetadataCacheKey(f"{title} {title_data.get('year') or ''}")
+    if isHashName(item):
+        return getMetadataCacheKey(f"{item.get('hash')} {query} {title_data.get('year') or ''}")
+    download_data = parseDownloadName(item.get("name"))
+    return getMetadataCacheKey(f"{download_data.get('title') or item.get('name')} {download_data.get('year') or ''}")
+
+async def getDownloadPage(session: SyncSession, type: DownloadType, offset: int, limit: int):
+    params = {
+        "limit": limit,
+        "offset": offset,
+        "bypass_cache": True,
+    }
+    async with session.mylist_limit:
+        response = await session.api_client.get(f"/{type.value}/mylist", params=params)
+    if response.status_code != 200:
+        raise Exception(f"Error fetching {type.value}. {response.status_code}")
+    return response.json().get("data", [])
+
+async def iterDownloadPages(session: SyncSession, type: DownloadType, limit: int = 1000):
+    """
+    Yields the pages of downloads of a type in order as they arrive.
+
+    The number of pages isn't known up front. The first page is requested alone, as most accounts
+    fit on it, and every window of full pages doubles the next one up to the mylist concurrency
+    limit, until a page comes back short.
+    """
+    window = 1
+    offset = 0
     while True:
-        params = {
-            "limit": limit,
-            "offset": offset,
-            "bypass_cache": True,
-        }
+        offsets = [offset + index * limit for index in range(window)]
+        pages = await asyncio.gather(*(getDownloadPage(session, type, page_offset, limit) for page_offset in offsets))
+        for data in pages:
+            if data:
+                yield data
+            if len(data) < limit:
+                return
+        offset += window * limit
+        window = min(window * 2, SYNC_API_CONCURRENCY)
+
+async def processGroup(session: SyncSession, group_key: str, members: list, type: DownloadType):
+    """Searches the metadata of a group of files once and applies it to every file, keeping their own season and episode"""
+    status, result, detail = await searchMetadata(session, group_key, members[0][3])
+    checked_at = time.time()
+    files = []
+    for data, title_data, query, _ in members:
+        metadata, found, _ = buildMetadata(status, result, detail, query, title_data, data["file_name"])
+        data.update(metadata)
+        # results of an unknown type are stored like a search without results
+        data["metadata_status"] = MetadataCache.FOUND if found else (MetadataCache.ERROR if status == MetadataCache.ERROR else MetadataCache.MISSING)
+        data["metadata_checked_at"] = checked_at
+        logging.debug(f"Processing data {data}")
+        files.append(data)
+    return files
+
+async def processFiles(session: SyncSession, files_to_process: list, type: DownloadType, outdated: list = ()):
+    """
+    Processes (item, file) pairs, stores them in one write and returns the data of the files that were stored.
+
+    The records in outdated, by document id, are deleted in the same write, so readers never see
+    the files they are replaced with missing while their metadata is searched.
+
+    All files are parsed first and grouped by the title and year of their download, so a season
+    pack or several downloads of the same show need a single metadata search.
+    """
+    files = []
+    if not files_to_process and not outdated:
+        return files
+
+    groups = {}
+    for item, file in files_to_process:
         try:
-            response = api_http_client.get(f"/{type.value}/mylist", params=params)
+            parsed = parseFile(item, file, type)
         except Exception as e:
-            logging.error(f"Error fetching {type.value}: {e}")
-            return None, False, f"Error fetching {type.value}: {e}"
-        if response.status_code != 200:
-            return None, False, f"Error fetching {type.value}. {response.status_code}"
-        data = response.json().get("data", [])
-        if not data:
-            break
-        file_data.extend(data)
-        offset += limit
-        if len(data) < limit:
-            break
-
-    if not file_data:
-        return None, True, f"No {type.value} found."
-    
-    logging.debug(f"Fetched {len(file_data)} {type.value} items from API.")
-    
-    files = []
-    
-    # Get the number of CPU cores for parallel processing
-    max_workers = int(multiprocessing.cpu_count() * 2 - 1)
-    logging.info(f"Processing files with {max_workers} parallel threads")
-    
-    # Collect all files to process
-    files_to_process = []
-    for item in file_data:
-        if not item.get("cached", False):
+            logging.error(f"Error processing file {file.get('short_name', 'unknown')}: {e}")
+            logging.error(traceback.format_exc())
             continue
-        for file in item.get("files", []):
-            files_to_process.append((item, file))
-    
-    # Process files in parallel
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks
-        future_to_file = {
-            executor.submit(process_file, item, file, type): (item, file) 
-            for item, file in files_to_process
-        }
-        
-        # Collect results as they complete
-        for future in as_completed(future_to_file):
-            try:
-                data = future.result()
-                logging.debug(f"Future result data: {data}")
-                if data:
-                    files.append(data)
-            except Exception as e:
-                item, file = future_to_file[future]
-                logging.error(f"Error processing file {file.get('short_name', 'unknown')}: {e}")
-                logging.error(traceback.format_exc())
-            
-    return files, True, f"{type.value.capitalize()} fetched successfully."
+        if parsed:
+            groups.setdefault(getTitleGroupKey(item, parsed[2], parsed[1]), []).append(parsed)
+
+    logging.info(f"Processing {len(files_to_process)} {type.value} files with {len(groups)} metadata searches, up to {SYNC_SEARCH_CONCURRENCY} at a time")
+    results = await asyncio.gather(
+        *(processGroup(session, group_key, members, type) for group_key, members in groups.items()),
+        return_exceptions=True,
+    )
+    for members, group_files in zip(groups.values(), results):
+        if isinstance(group_files, BaseException):
+            logging.error(f"Error processing {len(members)} files of {members[0][2]}: {group_files}")
+            logging.error("".join(traceback.format_exception(group_files)))
+            continue
+        files.extend(group_files)
+
+    # TinyDB writes block on file IO, keep them off the event loop
+    success, detail = await asyncio.to_thread(replaceMultipleData, list(outdated), files, type.value)
+    if not success:
+        logging.error(f"Error storing {len(files)} {type.value} files: {detail}")
+        return []
+    return files
+
+def getFileState(record: dict):
+    """
+    Returns the fields of a stored record that tell whether its file changed in the account.
+
+    Records whose metadata search failed, or found nothing long enough ago to search again, have no
+    state, so they never match the account and are processed again.
+    """
+    if isMetadataStale(record):
+        return None
+    return (record.get("folder_hash"), record.get("folder_name"), record.get("file_name"), record.get("file_size"))
+
+def isMetadataStale(record: dict):
+    """Returns whether the metadata search of a stored record should be done again, records stored before the status was kept are searched once more"""
+    status = record.get("metadata_status")
+    if status == MetadataCache.FOUND:
+        return False
+    if status == MetadataCache.ERROR:
+        return True
+    return metadata_cache.is_expired(status, record.get("metadata_checked_at") or 0)
+
+def getListedFileState(item: dict, file: dict):
+    return (item.get("hash"), item.get("name"), file.get("short_name"), file.get("size"))
+
+async def syncUserDownloads(session: SyncSession, type: DownloadType):
+    """
+    Brings the stored files of a download type in line with the account.
+
+    Downloads are matched to stored records by item id and file id. Only files that are new,
+    whose download hash, name or size changed or whose metadata search is due again are processed
+    again, files that are no longer in the account are deleted and everything else is kept as it is.
+
+    Pages of the account are processed while the next ones are fetched. At most
+    SYNC_API_CONCURRENCY pages wait in the queue, so fetching pauses when processing falls
+    behind and memory stays bounded by a few pages however large the account is. Files that
+    disappeared are only deleted once every page was listed.
+    """
+    stored, success, detail = await asyncio.to_thread(getAllData, type.value)
+    if not success:
+        return None, False, detail
 
-def searchMetadata(query: str, title_data: dict, file_name: str, full_title: str):
+    # only keep what the diff needs, not the full records
+    stored_files = {}
+    for record in stored:
+        stored_files.setdefault((record.get("item_id"), record.get("file_id")), []).append((record.doc_id, getFileState(record)))
+    del stored
+
+    pages = asyncio.Queue(maxsize=max(1, SYNC_API_CONCURRENCY))
+
+    async def fetchPages():
+        try:
+            async for page in iterDownloadPages(session, type):
+                await pages.put(page)
+        finally:
+            await pages.put(None)
+
+    fetcher = asyncio.ensure_future(fetchPages())
+    unchanged = 0
+    new = 0
+    changed = 0
+    synced = 0
+    try:
+        while True:
+            page = await pages.get()
+            if page is None:
+                break
+            files_to_process = []
+            outdated = []
+            for item in page:
+                if not item.get("cached", False):
+                    continue
+                for file in item.get("files", []):
+                    if not isAcceptedFile(file):
+                        continue
+                    records = stored_files.pop((item.get("id"), file.get("id")), [])
+                    if len(records) == 1 and records[0][1] == getListedFileState(item, file):
+                        unchanged += 1
+                        continue
+                    if records:
+                        changed += 1
+                        outdated.extend(doc_id for doc_id, _ in records)
+                    else:
+                        new += 1
+                    files_to_process.append((item, file))
+            synced += len(await processFiles(session, files_to_process, type, outdated))
+        # raises the error of a page that couldn't be fetched
+        await fetcher
+    except Exception as e:
+        return None, False, str(e)
+    finally:
+        fetcher.cancel()
+
+    removed = [doc_id for records in stored_files.values() for doc_id, _ in records]
+    success, detail = await asyncio.to_thread(deleteDataByIds, removed, type.value)
+    if not success:
+        return None, False, detail
+
+    logging.info(f"Synced {type.value}: {unchanged} unchanged, {new} new, {changed} changed, {len(removed)} removed")
+    total = unchanged + synced
+    if not total:
+        return 0, True, f"No {type.value} found."
+    return total, True, f"{type.value.capitalize()} synced successfully."
+
+async def syncAllUserDownloads():
+    """
+    Syncs every download type concurrently and returns the (type, (file count, success, detail)) of each.
+    """
+    session = SyncSession()
+    try:
+        results = await asyncio.gather(*(syncUserDownloads(session, download_type) for download_type in DownloadType))
+    finally:
+        await session.close()
+    return list(zip(DownloadType, results))
+
+async def lookupMetadata(session: SyncSession, full_title: str):
+    """Searches the metadata of a file and returns the cache status, the best result and a detail message"""
+    try:
+        async with session.search_limit:
+            response = await session.search_client.get(f"/meta/search/{full_title}", params={"type": "file"})
+    except httpx.TimeoutException:
+        logging.error("Timeout searching metadata.")
+        return MetadataCache.ERROR, None, "Timeout searching metadata."
+    except Exception as e:
+        logging.error(f"Error searching metadata: {e}")
+        return MetadataCache.ERROR, None, f"Error searching metadata: {e}"
+    if response.status_code != 200:
+        logging.error(f"Error searching metadata: {response.status_code}")
+        return MetadataCache.ERROR, None, f"Error searching metadata. {response.status_code}"
+    try:
+        results = response.json().get("data", [])
+    except ValueError as e:
+        logging.error(f"Error searching metadata: {e}")
+        return MetadataCache.ERROR, None, f"Error searching metadata: {e}"
+    if not results:
+        return MetadataCache.MISSING, None, "No metadata found."
+    return MetadataCache.FOUND, results[0], "Metadata found."
+
+async def searchMetadata(session: SyncSession, cache_key: str, full_title: str):
+    """
+    Returns the cache status, the best result and a detail message of a metadata search.
+
+    Results come from the metadata cache when possible. Concurrent searches for the same key,
+    such as the same show in two download types, share one request.
+    """
+    search = session.searches.get(cache_key)
+    if search is None:
+        search = asyncio.ensure_future(cachedLookupMetadata(session, cache_key, full_title))
+        session.searches[cache_key] = search
+    return await search
+
+async def cachedLookupMetadata(session: SyncSession, cache_key: str, full_title: str):
+    cached = metadata_cache.get(cache_key)
+    if cached is not None:
+        status, data = cached
+        return status, data, "Cached search failed recently."
+    status, data, detail = await lookupMetadata(session, full_title)
+    metadata_cache.put(cache_key, status, data)
+    return status, data, detail
+
+def buildMetadata(status: str, data: dict, detail: str, query: str, title_data: dict, file_name: str):
+    """Builds the metadata of a single file from the result of its metadata search"""
     base_metadata = {
         "metadata_title": cleanTitle(query),
         "metadata_link": None,
@@ -139,17 +398,11 @@ def searchMetadata(query: str, title_data: dict, file_name: str, full_title: str
         "metadata_rootfoldername": title_data.get("title", None),
     }
     extension = os.path.splitext(file_name)[-1]
+    if status == MetadataCache.ERROR:
+        return base_metadata, False, detail
+    if status == MetadataCache.MISSING:
+        return base_metadata, False, "No metadata found."
     try:
-        response = search_api_http_client.get(f"/meta/search/{full_title}", params={"type": "file"})
-    except Exception as e:
-        logging.error(f"Error searching metadata: {e}")
-        return base_metadata, False, f"Error searching metadata: {e}"
-    if response.status_code != 200:
-        logging.error(f"Error searching metadata: {response.status_code}")
-        return base_metadata, False, f"Error searching metadata. {response.status_code}"
-    try:
-        data = response.json().get("data", [])[0]
-
         title = cleanTitle(data.get("title"))
         base_metadata["metadata_title"] = title
         base_metadata["metadata_years"] = cleanYear(title_data.get("year", None) or data.get("releaseYears", None))
@@ -173,32 +426,113 @@ def searchMetadata(query: str, title_data: dict, file_name: str, full_title: str
         base_metadata["metadata_rootfoldername"] = f"{title} ({base_metadata['metadata_years']})"
 
         return base_metadata, True, "Metadata found."
-    except IndexError:
-        return base_metadata, False, "No metadata found."
-    except httpx.TimeoutException:
-        return base_metadata, False, "Timeout searching metadata."
     except Exception as e:
-        logging.error(f"Error searching metadata: {e}")
-        logging.error(f"Error searching metadata: {traceback.format_exc()}")
-        return base_metadata, False, f"Error searching metadata: {e}"
+        logging.error(f"Error building metadata: {e}")
+        logging.error(f"Error building metadata: {traceback.format_exc()}")
+        return base_metadata, False, f"Error building metadata: {e}"
 
 def getDownloadLink(url: str):
+    """
+    Resolves the API link of a file to the download link it redirects to.
+
+    Raises when the API doesn't redirect, so a failed resolution is retried instead of being cached.
+    """
     response = general_http_client.get(url)
     if response.status_code == httpx.codes.TEMPORARY_REDIRECT or response.status_code == httpx.codes.PERMANENT_REDIRECT or response.status_code == httpx.codes.FOUND:
-        return response.headers.get('Location')
-    return url
+        location = response.headers.get('Location')
+        if location:
+            return location
+    logging.error(f"Error resolving download link: {response.status_code}")
+    raise Exception(f"Error resolving download link: {response.status_code}")
 
-def downloadFile(url: str, size: int, offset: int = 0):
-    headers = {
-        "Range": f"bytes={offset}-{offset + size - 1}",
-        **general_http_client.headers,
-    }
-    response = general_http_client.get(url, headers=headers)
-    if response.status_code == httpx.codes.OK:
-        return response.content
-    elif response.status_code == httpx.codes.PARTIAL_CONTENT:
-        return response.content
-    else:
-        logging.error(f"Error downloading file: {response.status_code}")
-        raise Exception(f"Error downloading file: {response.status_code}")
-    
+class RangeStream:
+    """
+    An open-ended ranged download of a single file that is read incrementally.
+
+    Sequential reads continue on the same response, short forward skips are read through and
+    anything else (a seek or a new link) re-establishes the request at the new offset.
+    Only one thread may read from a stream at a time, callers hold stream.lock while iterating.
+    """
+    def __init__(self, chunk_size: int = 1024 * 256, max_skip: int = 1024 * 1024 * 2):
+        self.chunk_size = chunk_size
+        self.max_skip = max_skip
+        self.url = None
+        self.position = 0
+        self.response = None
+        self.chunks = None
+        self.leftover = b""
+        self.lock = threading.Lock()
+
+    def iter_range(self, url: str, offset: int, size: int, bounded: bool = False):
+        """
+        Yields the bytes offset..offset + size - 1 of the file as they arrive.
+        """
+        if self.response is None or url != self.url or offset < self.position or offset - self.position > self.max_skip:
+            self._open(url, offset, offset + size - 1 if bounded else None)
+        try:
+            while self.position < offset:
+                self._next(offset - self.position)
+            remaining = size
+            while remaining > 0:
+                chunk = self._next(remaining)
+                remaining -= len(chunk)
+                yield chunk
+        except BaseException:
+            # the position of the response is unknown now, start over on the next read
+            self._close()
+            raise
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def _open(self, url, offset, end=None):
+        self._close()
+        headers = {
+            "Range": f"bytes={offset}-{end if end is not None else ''}",
+            **general_http_client.headers,
+        }
+        request = general_http_client.build_request("GET", url, headers=headers)
+        response = general_http_client.send(request, stream=True)
+        if response.status_code == httpx.codes.PARTIAL_CONTENT:
+            self.position = offset
+        elif response.status_code == httpx.codes.OK:
+            # range was ignored, the body starts at the beginning of the file
+            self.position = 0
+        else:
+            response.close()
+            # a redirect means the link is an unresolved API link, not a download
+            if response.status_code in EXPIRED_LINK_STATUS_CODES or response.is_redirect:
+                logging.debug(f"Download link rejected with {response.status_code}")
+                raise DownloadLinkExpired(f"Download link rejected: {response.status_code}")
+            logging.error(f"Error downloading file: {response.status_code}")
+            raise Exception(f"Error downloading file: {response.status_code}")
+        self.url = url
+        self.response = response
+        self.chunks = response.iter_bytes(self.chunk_size)
+
+    def _next(self, limit):
+        chunk = self.leftover or next(self.chunks, b"")
+        if not chunk:
+            raise Exception("Download ended before the requested range was read")
+        self.leftover = chunk[limit:]
+        chunk = chunk[:limit]
+        self.position += len(chunk)
+        return chunk
+
+    def _close(self):
+        if self.response is not None:
+            self.response.close()
+        self.response = None
+        self.chunks = None
+        self.leftover = b""
+
+def streamFile(url: str, size: int, offset: int = 0):
+    """
+    Yields a bounded range of a file as it arrives.
+    """
+    stream = RangeStream()
+    try:
+        yield from stream.iter_range(url, offset, size, bounded=True)
+    finally:
+        stream.close()
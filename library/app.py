@@ -18,3 +18,12 @@ assert MOUNT_REFRESH_TIME in [e.name for e in MountRefreshTimes], f"Invalid moun
 MOUNT_REFRESH_TIME = MountRefreshTimes[MOUNT_REFRESH_TIME].value
 
 DEBUG_MODE = os.getenv("DEBUG_MODE", False) in [True,'true']
+
+# requests a sync keeps in flight at the same time, per API endpoint
+SYNC_API_CONCURRENCY = os.getenv("SYNC_API_CONCURRENCY", "4")
+assert SYNC_API_CONCURRENCY.isdigit() and int(SYNC_API_CONCURRENCY) > 0, "SYNC_API_CONCURRENCY must be a whole number greater than 0"
+SYNC_API_CONCURRENCY = int(SYNC_API_CONCURRENCY)
+
+SYNC_SEARCH_CONCURRENCY = os.getenv("SYNC_SEARCH_CONCURRENCY", "16")
+assert SYNC_SEARCH_CONCURRENCY.isdigit() and int(SYNC_SEARCH_CONCURRENCY) > 0, "SYNC_SEARCH_CONCURRENCY must be a whole number greater than 0"
+SYNC_SEARCH_CONCURRENCY = int(SYNC_SEARCH_CONCURRENCY)
@@ -0,0 +1,65 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# sizes are shown in megabytes
+FUSE_CACHE_SIZE = os.getenv("FUSE_CACHE_SIZE", "512")
+assert FUSE_CACHE_SIZE.isdigit() and int(FUSE_CACHE_SIZE) > 0, "FUSE_CACHE_SIZE must be a whole number of megabytes greater than 0"
+FUSE_CACHE_SIZE = int(FUSE_CACHE_SIZE)
+
+FUSE_CACHE_FILE_SIZE = os.getenv("FUSE_CACHE_FILE_SIZE", "128")
+assert FUSE_CACHE_FILE_SIZE.isdigit() and int(FUSE_CACHE_FILE_SIZE) > 0, "FUSE_CACHE_FILE_SIZE must be a whole number of megabytes greater than 0"
+FUSE_CACHE_FILE_SIZE = min(int(FUSE_CACHE_FILE_SIZE), FUSE_CACHE_SIZE)
+
+# number of blocks fetched ahead of a sequential reader, 0 disables read-ahead
+FUSE_READAHEAD_BLOCKS = os.getenv("FUSE_READAHEAD_BLOCKS", "4")
+assert FUSE_READAHEAD_BLOCKS.isdigit(), "FUSE_READAHEAD_BLOCKS must be a whole number"
+FUSE_READAHEAD_BLOCKS = int(FUSE_READAHEAD_BLOCKS)
+
+FUSE_READAHEAD_WORKERS = os.getenv("FUSE_READAHEAD_WORKERS", "8")
+assert FUSE_READAHEAD_WORKERS.isdigit() and int(FUSE_READAHEAD_WORKERS) > 0, "FUSE_READAHEAD_WORKERS must be a whole number greater than 0"
+FUSE_READAHEAD_WORKERS = int(FUSE_READAHEAD_WORKERS)
+
+# optional second cache tier on local disk, omit the path to disable
+FUSE_DISK_CACHE_PATH = os.getenv("FUSE_DISK_CACHE_PATH", None)
+
+FUSE_DISK_CACHE_SIZE = os.getenv("FUSE_DISK_CACHE_SIZE", "10240")
+assert FUSE_DISK_CACHE_SIZE.isdigit() and int(FUSE_DISK_CACHE_SIZE) > 0, "FUSE_DISK_CACHE_SIZE must be a whole number of megabytes greater than 0"
+FUSE_DISK_CACHE_SIZE = int(FUSE_DISK_CACHE_SIZE)
+
+# resolved download links are shown in minutes
+FUSE_LINK_TTL = os.getenv("FUSE_LINK_TTL", "60")
+assert FUSE_LINK_TTL.isdigit() and int(FUSE_LINK_TTL) > 0, "FUSE_LINK_TTL must be a whole number of minutes greater than 0"
+FUSE_LINK_TTL = int(FUSE_LINK_TTL)
+
+FUSE_LINK_RETRIES = os.getenv("FUSE_LINK_RETRIES", "2")
+assert FUSE_LINK_RETRIES.isdigit(), "FUSE_LINK_RETRIES must be a whole number"
+FUSE_LINK_RETRIES = int(FUSE_LINK_RETRIES)
+
+# memory kept for the start and end of files that media servers read when probing them, 0 disables it
+FUSE_PROBE_CACHE_SIZE = os.getenv("FUSE_PROBE_CACHE_SIZE", "256")
+assert FUSE_PROBE_CACHE_SIZE.isdigit(), "FUSE_PROBE_CACHE_SIZE must be a whole number of megabytes"
+FUSE_PROBE_CACHE_SIZE = int(FUSE_PROBE_CACHE_SIZE)
+
+# probe sizes are shown in kilobytes
+FUSE_PROBE_HEAD_SIZE = os.getenv("FUSE_PROBE_HEAD_SIZE", "2048")
+assert FUSE_PROBE_HEAD_SIZE.isdigit(), "FUSE_PROBE_HEAD_SIZE must be a whole number of kilobytes"
+FUSE_PROBE_HEAD_SIZE = int(FUSE_PROBE_HEAD_SIZE)
+
+FUSE_PROBE_TAIL_SIZE = os.getenv("FUSE_PROBE_TAIL_SIZE", "2048")
+assert FUSE_PROBE_TAIL_SIZE.isdigit(), "FUSE_PROBE_TAIL_SIZE must be a whole number of kilobytes"
+FUSE_PROBE_TAIL_SIZE = int(FUSE_PROBE_TAIL_SIZE)
+
+FUSE_PROBE_BLOCK_SIZE = os.getenv("FUSE_PROBE_BLOCK_SIZE", "512")
+assert FUSE_PROBE_BLOCK_SIZE.isdigit() and int(FUSE_PROBE_BLOCK_SIZE) > 0, "FUSE_PROBE_BLOCK_SIZE must be a whole number of kilobytes greater than 0"
+FUSE_PROBE_BLOCK_SIZE = int(FUSE_PROBE_BLOCK_SIZE)
+
+FUSE_PROBE_WARM = os.getenv("FUSE_PROBE_WARM", "false").lower()
+assert FUSE_PROBE_WARM in ["true", "false"], "FUSE_PROBE_WARM must be either true or false"
+FUSE_PROBE_WARM = FUSE_PROBE_WARM == "true"
+
+# largest single download in megabytes while a file is being streamed, fetches start smaller and grow to this
+FUSE_STREAM_FETCH_SIZE = os.getenv("FUSE_STREAM_FETCH_SIZE", "64")
+assert FUSE_STREAM_FETCH_SIZE.isdigit() and int(FUSE_STREAM_FETCH_SIZE) > 0, "FUSE_STREAM_FETCH_SIZE must be a whole number of megabytes greater than 0"
+FUSE_STREAM_FETCH_SIZE = int(FUSE_STREAM_FETCH_SIZE)
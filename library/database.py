@@ -0,0 +1,16 @@
+import os
+from dotenv import load_dotenv
+from enum import Enum
+
+load_dotenv()
+
+class DatabaseBackends(Enum):
+    sqlite = "sqlite"
+    json = "json"
+
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", DatabaseBackends.sqlite.value).lower()
+assert DATABASE_BACKEND in [backend.value for backend in DatabaseBackends], f"Invalid database backend: {DATABASE_BACKEND}. Valid options are: {[backend.value for backend in DatabaseBackends]}"
+
+# file the sqlite backend keeps every table in
+DATABASE_PATH = os.getenv("DATABASE_PATH", "torbox.db")
+assert DATABASE_PATH, "DATABASE_PATH must not be empty"
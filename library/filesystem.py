@@ -19,7 +19,36 @@ assert MOUNT_METHOD in [method.value for method in MountMethods], "MOUNT_METHOD
 MOUNT_PATH = os.getenv("MOUNT_PATH", "./torbox")
 assert MOUNT_PATH, "MOUNT_PATH is not set in .env file"
 
+# file the strm mount method keeps the list of strm files it wrote in
+STRM_MANIFEST_PATH = os.getenv("STRM_MANIFEST_PATH", "strm_manifest.json")
+assert STRM_MANIFEST_PATH, "STRM_MANIFEST_PATH must not be empty"
+
+STRM_WRITE_WORKERS = os.getenv("STRM_WRITE_WORKERS", "8")
+assert STRM_WRITE_WORKERS.isdigit() and int(STRM_WRITE_WORKERS) > 0, "STRM_WRITE_WORKERS must be a whole number greater than 0"
+STRM_WRITE_WORKERS = int(STRM_WRITE_WORKERS)
+
+STRM_STAGED = os.getenv("STRM_STAGED", "false").lower()
+assert STRM_STAGED in ["true", "false"], "STRM_STAGED must be either true or false"
+STRM_STAGED = STRM_STAGED == "true"
+
 SYMLINK_PATH = os.getenv("SYMLINK_PATH", None)
 
 SYMLINK_CREATION = os.getenv("SYMLINK_CREATION", "always")
 assert SYMLINK_CREATION in [symlink.value for symlink in SymlinkCreation], "SYMLINK_CREATION is not set correctly in .env file"
+
+FUSE_MULTITHREADED = os.getenv("FUSE_MULTITHREADED", "true").lower()
+assert FUSE_MULTITHREADED in ["true", "false"], "FUSE_MULTITHREADED must be either true or false"
+FUSE_MULTITHREADED = FUSE_MULTITHREADED == "true"
+
+# how long in seconds the kernel may cache file attributes and directory entries of the fuse mount
+FUSE_ATTR_TIMEOUT = os.getenv("FUSE_ATTR_TIMEOUT", "60")
+assert FUSE_ATTR_TIMEOUT.isdigit(), "FUSE_ATTR_TIMEOUT must be a whole number of seconds"
+FUSE_ATTR_TIMEOUT = int(FUSE_ATTR_TIMEOUT)
+
+FUSE_ENTRY_TIMEOUT = os.getenv("FUSE_ENTRY_TIMEOUT", "60")
+assert FUSE_ENTRY_TIMEOUT.isdigit(), "FUSE_ENTRY_TIMEOUT must be a whole number of seconds"
+FUSE_ENTRY_TIMEOUT = int(FUSE_ENTRY_TIMEOUT)
+
+FUSE_KERNEL_CACHE = os.getenv("FUSE_KERNEL_CACHE", "true").lower()
+assert FUSE_KERNEL_CACHE in ["true", "false"], "FUSE_KERNEL_CACHE must be either true or false"
+FUSE_KERNEL_CACHE = FUSE_KERNEL_CACHE == "true"
@@ -1,11 +1,33 @@
+import os
 import httpx
+from dotenv import load_dotenv
 from library.torbox import TORBOX_API_KEY
+from library.ratelimit import HostRateLimiter, RateLimitedTransport, AsyncRateLimitedTransport
+
+load_dotenv()
 
 TORBOX_API_URL = "https://api.torbox.app/v1/api"
 TORBOX_SEARCH_API_URL = "https://search-api.torbox.app"
 
-transport = httpx.HTTPTransport(
-    retries=5
+# requests per second sent to each API, shared by syncing and resolving download links
+TORBOX_API_RATE = os.getenv("TORBOX_API_RATE", "5")
+assert TORBOX_API_RATE.replace(".", "", 1).isdigit() and float(TORBOX_API_RATE) > 0, "TORBOX_API_RATE must be a number of requests per second greater than 0"
+TORBOX_API_RATE = float(TORBOX_API_RATE)
+
+TORBOX_SEARCH_API_RATE = os.getenv("TORBOX_SEARCH_API_RATE", "10")
+assert TORBOX_SEARCH_API_RATE.replace(".", "", 1).isdigit() and float(TORBOX_SEARCH_API_RATE) > 0, "TORBOX_SEARCH_API_RATE must be a number of requests per second greater than 0"
+TORBOX_SEARCH_API_RATE = float(TORBOX_SEARCH_API_RATE)
+
+host_limiters = {
+    httpx.URL(TORBOX_API_URL).host: HostRateLimiter(httpx.URL(TORBOX_API_URL).host, rate=TORBOX_API_RATE, burst=max(1, int(TORBOX_API_RATE)), max_concurrency=8),
+    httpx.URL(TORBOX_SEARCH_API_URL).host: HostRateLimiter(httpx.URL(TORBOX_SEARCH_API_URL).host, rate=TORBOX_SEARCH_API_RATE, burst=max(1, int(TORBOX_SEARCH_API_RATE)), max_concurrency=32),
+}
+
+transport = RateLimitedTransport(
+    httpx.HTTPTransport(
+        retries=5
+    ),
+    host_limiters,
 )
 
 api_http_client = httpx.Client(
@@ -39,3 +61,28 @@ general_http_client = httpx.Client(
     follow_redirects=False,
     transport=transport,
 )
+
+# async clients are bound to the event loop they are used in, each sync creates its own
+def createAsyncApiHttpClient():
+    return httpx.AsyncClient(
+        base_url=TORBOX_API_URL,
+        headers={
+            "Authorization": f"Bearer {TORBOX_API_KEY}",
+            "User-Agent": "TorBox-Media-Center/1.0 TorBox/1.0",
+        },
+        timeout=httpx.Timeout(60),
+        follow_redirects=True,
+        transport=AsyncRateLimitedTransport(httpx.AsyncHTTPTransport(retries=5), host_limiters),
+    )
+
+def createAsyncSearchApiHttpClient():
+    return httpx.AsyncClient(
+        base_url=TORBOX_SEARCH_API_URL,
+        headers={
+            "Authorization": f"Bearer {TORBOX_API_KEY}",
+            "User-Agent": "TorBox-Media-Center/1.0 TorBox/1.0",
+        },
+        timeout=httpx.Timeout(60),
+        follow_redirects=True,
+        transport=AsyncRateLimitedTransport(httpx.AsyncHTTPTransport(retries=5), host_limiters),
+    )
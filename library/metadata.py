@@ -0,0 +1,26 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# file the metadata search results are kept in between runs
+METADATA_CACHE_PATH = os.getenv("METADATA_CACHE_PATH", "metadata_cache.json")
+
+# found metadata is shown in days
+METADATA_CACHE_TTL = os.getenv("METADATA_CACHE_TTL", "30")
+assert METADATA_CACHE_TTL.isdigit(), "METADATA_CACHE_TTL must be a whole number of days"
+METADATA_CACHE_TTL = int(METADATA_CACHE_TTL)
+
+# searches without a result are shown in hours
+METADATA_CACHE_MISS_TTL = os.getenv("METADATA_CACHE_MISS_TTL", "24")
+assert METADATA_CACHE_MISS_TTL.isdigit(), "METADATA_CACHE_MISS_TTL must be a whole number of hours"
+METADATA_CACHE_MISS_TTL = int(METADATA_CACHE_MISS_TTL)
+
+# failed searches are shown in minutes
+METADATA_CACHE_ERROR_TTL = os.getenv("METADATA_CACHE_ERROR_TTL", "10")
+assert METADATA_CACHE_ERROR_TTL.isdigit(), "METADATA_CACHE_ERROR_TTL must be a whole number of minutes"
+METADATA_CACHE_ERROR_TTL = int(METADATA_CACHE_ERROR_TTL)
+
+METADATA_CACHE_SIZE = os.getenv("METADATA_CACHE_SIZE", "100000")
+assert METADATA_CACHE_SIZE.isdigit(), "METADATA_CACHE_SIZE must be a whole number of entries"
+METADATA_CACHE_SIZE = int(METADATA_CACHE_SIZE)
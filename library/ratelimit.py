@@ -0,0 +1,207 @@
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+import httpx
+
+# responses that mean the host wants us to slow down, they are retried after a backoff
+RETRY_STATUS_CODES = [
+    httpx.codes.TOO_MANY_REQUESTS,
+    httpx.codes.SERVICE_UNAVAILABLE,
+]
+
+class HostRateLimiter:
+    """
+    The request budget of a single API host, shared by every client and thread talking to it.
+
+    A token bucket spaces requests out to rate per second with bursts of up to burst requests.
+    On top of that the number of requests in flight is adjusted with AIMD: it grows by one after
+    a full window of fast successful requests and is halved when the host throttles, fails or
+    answers slower than slow_latency. A Retry-After from the host pauses all requests until it
+    has passed. Waiting works from threads as well as from asyncio.
+    """
+    def __init__(self, host: str, rate: float, burst: int, max_concurrency: int, min_concurrency: int = 1, slow_latency: float = 5.0):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.slow_latency = slow_latency
+        self.limit = max_concurrency
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.paused_until = 0.0
+        self.in_flight = 0
+        self.successes = 0
+        self.decreased_at = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def _try_acquire(self):
+        """
+        Takes a slot and a token if both are available, otherwise returns how long to wait before trying again.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight >= self.limit:
+                # a slot frees up when a request finishes, check again shortly
+                return 0.05
+            self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+            self.refilled_at = now
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+            self.in_flight += 1
+            self.requests += 1
+            return 0
+
+    def acquire(self):
+        while True:
+            delay = self._try_acquire()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    async def acquire_async(self):
+        while True:
+            delay = self._try_acquire()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    def release(self, latency: float, failed: bool = False, throttled: bool = False, retry_after: float = None):
+        """
+        Returns the slot of a finished request and adjusts the concurrency limit from how it went.
+        """
+        with self.lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttled += 1
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            if failed or throttled or latency > self.slow_latency:
+                self.successes = 0
+                # requests that were already in flight report the same trouble, only back off once for them
+                if now - self.decreased_at > self.slow_latency and self.limit > self.min_concurrency:
+                    self.limit = max(self.min_concurrency, self.limit // 2)
+                    self.decreased_at = now
+                    logging.debug(f"Reduced concurrency for {self.host} to {self.limit}")
+                return
+            self.successes += 1
+            if self.successes >= self.limit and self.limit < self.max_concurrency:
+                self.limit += 1
+                self.successes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "requests": self.requests,
+                "throttled": self.throttled,
+            }
+
+def getRetryAfter(response: httpx.Response):
+    """
+    Returns the seconds the Retry-After header of a response asks to wait, or None without a valid one.
+    """
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def getRetryDelay(retry_after: float, attempt: int, base_delay: float = 1.0, max_delay: float = 60.0):
+    """
+    Returns how long to wait before retrying a throttled request.
+
+    Uses exponential backoff with full jitter, but never less than the Retry-After of the response.
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    return min(max(delay, retry_after or 0), max_delay)
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """
+    Sends requests to hosts with a limiter through it, retrying the ones the host throttled.
+
+    Requests to other hosts, such as the download servers links redirect to, are passed through.
+    """
+    def __init__(self, transport: httpx.BaseTransport, limiters: dict, max_retries: int = 5):
+        self.transport = transport
+        self.limiters = limiters
+        self.max_retries = max_retries
+
+    def handle_request(self, request):
+        limiter = self.limiters.get(request.url.host)
+        if limiter is None:
+            return self.transport.handle_request(request)
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = self.transport.handle_request(request)
+            except Exception:
+                limiter.release(time.monotonic() - started, failed=True)
+                raise
+            latency = time.monotonic() - started
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                retry_after = getRetryAfter(response)
+                delay = getRetryDelay(retry_after, attempt)
+                response.close()
+                limiter.release(latency, throttled=True, retry_after=retry_after)
+                logging.debug(f"{request.url.host} answered {response.status_code}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            limiter.release(latency, failed=response.status_code >= 500)
+            return response
+
+    def close(self):
+        self.transport.close()
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """
+    The asyncio counterpart of RateLimitedTransport, sharing the same limiters.
+    """
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiters: dict, max_retries: int = 5):
+        self.transport = transport
+        self.limiters = limiters
+        self.max_retries = max_retries
+
+    async def handle_async_request(self, request):
+        limiter = self.limiters.get(request.url.host)
+        if limiter is None:
+            return await self.transport.handle_async_request(request)
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire_async()
+            started = time.monotonic()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except Exception:
+                limiter.release(time.monotonic() - started, failed=True)
+                raise
+            latency = time.monotonic() - started
+            if response.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                retry_after = getRetryAfter(response)
+                delay = getRetryDelay(retry_after, attempt)
+                await response.aclose()
+                limiter.release(latency, throttled=True, retry_after=retry_after)
+                logging.debug(f"{request.url.host} answered {response.status_code}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            limiter.release(latency, failed=response.status_code >= 500)
+            return response
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -1,10 +1,11 @@
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.schedulers.background import BackgroundScheduler
-from functions.appFunctions import bootUp, getMountMethod, getAllUserDownloadsFresh, getMountRefreshTime
+from functions.appFunctions import bootUp, getMountMethod, getAllUserDownloads, getAllUserDownloadsFresh, getMountRefreshTime
 from functions.databaseFunctions import closeAllDatabases
 from library.app import DEBUG_MODE
 import logging
 from sys import platform
+from datetime import datetime
 import os
 
 logging.basicConfig(
@@ -29,13 +30,21 @@ if __name__ == "__main__":
         logging.error("Invalid mount method specified.")
         exit(1)
 
-    user_downloads = getAllUserDownloadsFresh()
+    # the library stored by the last run is served right away and refreshed in the background
+    user_downloads = getAllUserDownloads()
+    refresh_options = {}
+    if user_downloads:
+        logging.info(f"Starting with {len(user_downloads)} files from the last refresh, refreshing in the background...")
+        refresh_options["next_run_time"] = datetime.now()
+    else:
+        user_downloads = getAllUserDownloadsFresh()
 
     scheduler.add_job(
         getAllUserDownloadsFresh,
         "interval",
         hours=getMountRefreshTime(),
         id="get_all_user_downloads_fresh",
+        **refresh_options,
     )
 
     try:
@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+# settings are read when the modules are imported, keep the state of the tests out of the working directory
+work_path = tempfile.mkdtemp(prefix="torbox-tests-")
+os.environ.setdefault("TORBOX_API_KEY", "test")
+os.environ["METADATA_CACHE_PATH"] = os.path.join(work_path, "metadata_cache.json")
+os.environ["DATABASE_PATH"] = os.path.join(work_path, "torbox.db")
+os.environ["STRM_MANIFEST_PATH"] = os.path.join(work_path, "strm_manifest.json")
+os.environ["MOUNT_PATH"] = os.path.join(work_path, "torbox")
+
+import httpx # noqa: E402
+import pytest # noqa: E402
+
+from functions.torboxFunctions import SyncSession # noqa: E402
+
+def unexpectedRequest(request: httpx.Request):
+    return httpx.Response(404)
+
+@pytest.fixture
+def mock_session():
+    """
+    Returns an async function creating a SyncSession whose API and search clients are answered by the given handlers.
+    """
+    async def createSession(api=unexpectedRequest, search=unexpectedRequest):
+        session = SyncSession()
+        await session.api_client.aclose()
+        await session.search_client.aclose()
+        session.api_client = httpx.AsyncClient(base_url="http://api", transport=httpx.MockTransport(api))
+        session.search_client = httpx.AsyncClient(base_url="http://search", transport=httpx.MockTransport(search))
+        return session
+
+    return createSession
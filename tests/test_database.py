@@ -0,0 +1,90 @@
+import json
+import sqlite3
+
+import pytest
+
+from functions.databaseFunctions import JSONDatabase, SQLiteDatabase, deleteDataByField, getAllData, insertMultipleData, clearDatabase
+
+def createSymlinks(item_id: int):
+    return [
+        {"item_id": item_id, "file_id": file_id, "symlink_path": f"/symlinks/series/Show/Season 1/Show S01E0{file_id}.mkv"}
+        for file_id in range(1, 4)
+    ]
+
+def test_removing_a_symlink_keeps_the_other_files_of_its_download():
+    clearDatabase("symlinks")
+    insertMultipleData(createSymlinks(1), "symlinks")
+    success, detail = deleteDataByField("symlink_path", "/symlinks/series/Show/Season 1/Show S01E02.mkv", "symlinks")
+    assert success, detail
+    records = getAllData("symlinks")[0]
+    assert sorted(record["file_id"] for record in records) == [1, 3]
+
+def test_removing_by_an_unindexed_field_is_refused():
+    success, _ = deleteDataByField("file_name", "Show S01E01.mkv", "symlinks")
+    assert not success
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_backends_remove_by_field(backend, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = JSONDatabase("symlinks") if backend == "json" else SQLiteDatabase(str(tmp_path / "torbox.db"), "symlinks")
+    try:
+        db.insert_multiple(createSymlinks(1) + createSymlinks(2))
+        db.remove_field("symlink_path", "/symlinks/series/Show/Season 1/Show S01E01.mkv")
+        assert len(db.all()) == 4
+        db.remove_field("item_id", 2)
+        assert [record["file_id"] for record in db.all()] == [2, 3]
+    finally:
+        db.close()
+
+def createEpisode(file_id: int):
+    return {
+        "item_id": 1,
+        "file_id": file_id,
+        "path": f"Show S01/Show.S01E0{file_id}.mkv",
+        "metadata_mediatype": "series",
+        "metadata_rootfoldername": "Show (2020)",
+        "metadata_foldername": "Season 1",
+        "metadata_filename": f"Show (2020) S01E0{file_id}.mkv",
+    }
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_backends_find_by_mount_path(backend, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = JSONDatabase("torrents") if backend == "json" else SQLiteDatabase(str(tmp_path / "torbox.db"), "torrents")
+    try:
+        db.insert_multiple([createEpisode(1), createEpisode(2)])
+        found = db.find("mount_path", "/series/Show (2020)/Season 1/Show (2020) S01E02.mkv")
+        assert [record["file_id"] for record in found] == [2]
+        # the path of the file inside its download is a field of the record like any other
+        assert found[0]["path"] == "Show S01/Show.S01E02.mkv"
+    finally:
+        db.close()
+
+def test_sqlite_tables_with_a_path_column_are_migrated(tmp_path):
+    path = str(tmp_path / "torbox.db")
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE "torrents" (doc_id INTEGER PRIMARY KEY, item_id, file_id, symlink_path TEXT, path TEXT, data TEXT NOT NULL)')
+    connection.execute('CREATE INDEX "torrents_path" ON "torrents" (path)')
+    connection.execute('INSERT INTO "torrents" (item_id, file_id, path, data) VALUES (?, ?, ?, ?)', (1, 1, "/series/Show (2020)/Season 1/Show (2020) S01E01.mkv", json.dumps(createEpisode(1))))
+    connection.commit()
+    connection.close()
+    db = SQLiteDatabase(path, "torrents")
+    try:
+        assert len(db.find("mount_path", "/series/Show (2020)/Season 1/Show (2020) S01E01.mkv")) == 1
+        db.insert(createEpisode(2))
+        assert len(db.find("mount_path", "/series/Show (2020)/Season 1/Show (2020) S01E02.mkv")) == 1
+    finally:
+        db.close()
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_backends_replace_in_one_write(backend, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = JSONDatabase("torrents") if backend == "json" else SQLiteDatabase(str(tmp_path / "torbox.db"), "torrents")
+    try:
+        db.insert_multiple([createEpisode(1), createEpisode(2)])
+        outdated = [record.doc_id for record in db.all() if record["file_id"] == 2]
+        updated = dict(createEpisode(2), file_size=200)
+        db.replace_multiple(outdated, [updated])
+        assert sorted((record["file_id"], record.get("file_size")) for record in db.all()) == [(1, None), (2, 200)]
+    finally:
+        db.close()
@@ -0,0 +1,67 @@
+import builtins
+import errno
+import os
+import threading
+
+from functions.cacheFunctions import BlockCache, DiskCache
+
+BLOCK_SIZE = 64 * 1024
+
+def createDiskCache(tmp_path, blocks: int):
+    disk = DiskCache(str(tmp_path), 1024 * 1024 * 1024, BLOCK_SIZE)
+    for index in range(blocks):
+        disk.put(("file", index), bytes([index]) * BLOCK_SIZE)
+    disk.writer.shutdown(wait=True)
+    return disk
+
+def test_blocks_read_from_disk_keep_no_file_open(tmp_path):
+    disk = createDiskCache(tmp_path, 20)
+    cache = BlockCache(1024 * 1024 * 1024, 1024 * 1024 * 1024, disk)
+    open_files = len(os.listdir("/proc/self/fd"))
+    for index in range(20):
+        assert cache.get(("file", index)) == bytes([index]) * BLOCK_SIZE
+    assert len(os.listdir("/proc/self/fd")) == open_files
+
+def test_blocks_are_kept_when_they_cannot_be_opened(tmp_path, monkeypatch):
+    disk = createDiskCache(tmp_path, 1)
+
+    def exhausted(*args, **kwargs):
+        raise OSError(errno.EMFILE, "Too many open files")
+
+    monkeypatch.setattr(builtins, "open", exhausted)
+    assert disk.get(("file", 0)) is None
+    monkeypatch.undo()
+    assert ("file", 0) in disk
+    assert disk.get(("file", 0)) == bytes([0]) * BLOCK_SIZE
+
+def test_missing_blocks_are_dropped(tmp_path):
+    disk = createDiskCache(tmp_path, 1)
+    for name in os.listdir(tmp_path):
+        if name != DiskCache.INDEX_FILE:
+            os.remove(os.path.join(tmp_path, name))
+    assert disk.get(("file", 0)) is None
+    assert ("file", 0) not in disk
+
+def test_only_stale_blocks_are_removed_on_startup(tmp_path):
+    for name in ["notes.txt", "torbox.db", ".env", "torrents-1-0.3", "torrents-1-0.4.tmp"]:
+        (tmp_path / name).write_bytes(b"data")
+    DiskCache(str(tmp_path), 1024 * 1024, BLOCK_SIZE)
+    assert sorted(os.listdir(tmp_path)) == [".env", "notes.txt", "torbox.db"]
+
+def test_writes_beyond_the_queue_are_dropped(tmp_path, monkeypatch):
+    disk = DiskCache(str(tmp_path), 1024 * 1024 * 1024, BLOCK_SIZE, max_queued_bytes=2 * BLOCK_SIZE)
+    written = threading.Event()
+    write = disk._write
+
+    def slowWrite(name, data):
+        written.wait()
+        write(name, data)
+
+    monkeypatch.setattr(disk, "_write", slowWrite)
+    for index in range(4):
+        disk.put(("file", index), bytes([index]) * BLOCK_SIZE)
+    written.set()
+    disk.writer.shutdown(wait=True)
+    assert disk.stats()["dropped"] == 2
+    assert disk.queued_bytes == 0
+    assert ("file", 1) in disk and ("file", 2) not in disk
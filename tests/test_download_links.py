@@ -0,0 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from functions import torboxFunctions
+from functions.cacheFunctions import LinkCache
+from functions.torboxFunctions import DownloadLinkExpired, RangeStream, getDownloadLink
+
+API_LINK = "https://api.torbox.app/v1/api/torrents/requestdl?torrent_id=1&file_id=0&redirect=true"
+
+def useTransport(monkeypatch, handler):
+    monkeypatch.setattr(torboxFunctions, "general_http_client", httpx.Client(transport=httpx.MockTransport(handler), follow_redirects=False))
+
+def test_failed_resolutions_are_not_cached(monkeypatch):
+    responses = [httpx.Response(500), httpx.Response(302, headers={"Location": "https://cdn/file.mkv"})]
+    useTransport(monkeypatch, lambda request: responses.pop(0))
+    links = LinkCache(getDownloadLink, 3600, ThreadPoolExecutor(max_workers=1))
+    with pytest.raises(Exception):
+        links.get("torrents-1-0", API_LINK)
+    assert links.stats()["failures"] == 1
+    assert links.get("torrents-1-0", API_LINK) == "https://cdn/file.mkv"
+
+def test_redirected_reads_resolve_the_link_again(monkeypatch):
+    useTransport(monkeypatch, lambda request: httpx.Response(302, headers={"Location": "https://cdn/file.mkv"}))
+    with pytest.raises(DownloadLinkExpired):
+        list(RangeStream().iter_range(API_LINK, 0, 10))
@@ -0,0 +1,37 @@
+import asyncio
+
+import httpx
+import pytest
+
+from functions.torboxFunctions import DownloadType, iterDownloadPages
+
+def fetchPages(mock_session, total: int, limit: int = 10):
+    offsets = []
+
+    def mylist(request: httpx.Request):
+        offset = int(request.url.params["offset"])
+        offsets.append(offset)
+        data = [{"id": index} for index in range(offset, min(offset + limit, total))]
+        return httpx.Response(200, json={"data": data})
+
+    async def run():
+        session = await mock_session(api=mylist)
+        try:
+            return [page async for page in iterDownloadPages(session, DownloadType.torrent, limit)]
+        finally:
+            await session.close()
+
+    pages = asyncio.run(run())
+    return [item["id"] for page in pages for item in page], offsets
+
+def test_short_first_page_is_the_only_request(mock_session):
+    ids, offsets = fetchPages(mock_session, 7)
+    assert ids == list(range(7))
+    assert offsets == [0]
+
+# windows of 1, 2 and then 4 pages with the default concurrency
+@pytest.mark.parametrize("total, requests", [(10, 3), (35, 7), (100, 11)])
+def test_full_pages_widen_the_window(mock_session, total, requests):
+    ids, offsets = fetchPages(mock_session, total)
+    assert ids == list(range(total))
+    assert sorted(offsets) == [index * 10 for index in range(requests)]
@@ -0,0 +1,36 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("fuse")
+
+from functions.cacheFunctions import BlockCache # noqa: E402
+from functions.fuseFilesystemFunctions import FileHandle, FileNode, TorBoxMediaCenterFuse # noqa: E402
+
+BLOCK_SIZE = 1024
+
+def createFilesystem():
+    # only the parts of the mount that reads go through, without starting the refresh thread
+    filesystem = TorBoxMediaCenterFuse.__new__(TorBoxMediaCenterFuse)
+    filesystem.block_size = BLOCK_SIZE
+    filesystem.cache = BlockCache(1024 * 1024, 1024 * 1024)
+    filesystem.partial_blocks = {}
+    filesystem.partial_blocks_lock = threading.Lock()
+    filesystem.fetch_executor = ThreadPoolExecutor(max_workers=1)
+    return filesystem
+
+def createHandle():
+    file = FileNode({"type": "torrents", "item_id": 1, "file_id": 0, "file_size": 4 * BLOCK_SIZE, "download_link": "http://api/requestdl"})
+    return FileHandle(1, "/movies/Movie (2020)/Movie (2020).mkv", file)
+
+@pytest.mark.parametrize("inline", [True, False])
+def test_extent_of_blocks_cached_after_the_miss(inline):
+    filesystem = createFilesystem()
+    handle = createHandle()
+    # the block arrives in the cache between the read missing it and the extent being started
+    filesystem.cache.put((handle.file.key, 0), b"a" * BLOCK_SIZE)
+    partial = filesystem._startExtent(handle, 0, 1, inline=inline)
+    filesystem.fetch_executor.shutdown(wait=True)
+    assert partial.done
+    assert bytes(partial.data) == b"a" * BLOCK_SIZE
@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+
+from functions import torboxFunctions
+from functions.cacheFunctions import MetadataCache
+from functions.databaseFunctions import clearDatabase, getAllData
+from functions.torboxFunctions import DownloadType, syncUserDownloads
+
+ITEMS = [{
+    "id": 10,
+    "hash": "hash10",
+    "name": "Show S01 1080p",
+    "created_at": "2024-05-01T12:00:00Z",
+    "cached": True,
+    "files": [{"id": 0, "short_name": "Show.S01E01.1080p.mkv", "name": "Show S01 1080p/Show.S01E01.1080p.mkv", "size": 100, "mimetype": "video/x-matroska"}],
+}]
+
+def mylist(request: httpx.Request):
+    data = ITEMS if request.url.path.endswith("/torrents/mylist") and request.url.params["offset"] == "0" else []
+    return httpx.Response(200, json={"data": data})
+
+def sync(mock_session, search):
+    searches = []
+
+    def handler(request: httpx.Request):
+        searches.append(request.url.path)
+        return search(request)
+
+    async def run():
+        session = await mock_session(api=mylist, search=handler)
+        try:
+            return await syncUserDownloads(session, DownloadType.torrent)
+        finally:
+            await session.close()
+
+    count, success, detail = asyncio.run(run())
+    assert success, detail
+    return searches, getAllData(DownloadType.torrent.value)[0]
+
+def failing(request: httpx.Request):
+    return httpx.Response(500)
+
+def found(request: httpx.Request):
+    return httpx.Response(200, json={"data": [{"title": "Show", "type": "series", "releaseYears": 2020}]})
+
+def test_failed_metadata_searches_are_retried(mock_session):
+    clearDatabase(DownloadType.torrent.value)
+    torboxFunctions.metadata_cache.entries.clear()
+
+    searches, records = sync(mock_session, failing)
+    assert len(searches) == 1
+    assert records[0]["metadata_status"] == MetadataCache.ERROR
+    assert records[0]["metadata_mediatype"] == "movie"
+
+    torboxFunctions.metadata_cache.entries.clear()
+    searches, records = sync(mock_session, found)
+    assert len(searches) == 1
+    assert len(records) == 1
+    assert records[0]["metadata_status"] == MetadataCache.FOUND
+    assert records[0]["metadata_mediatype"] == "series"
+
+    searches, records = sync(mock_session, found)
+    assert searches == []
+    assert len(records) == 1
+
+def test_changed_files_stay_stored_while_they_are_searched(mock_session):
+    clearDatabase(DownloadType.torrent.value)
+    torboxFunctions.metadata_cache.entries.clear()
+    sync(mock_session, found)
+    ITEMS[0]["files"][0]["size"] = 200
+    stored_during_search = []
+
+    def searching(request: httpx.Request):
+        stored_during_search.extend(getAllData(DownloadType.torrent.value)[0])
+        return found(request)
+
+    try:
+        torboxFunctions.metadata_cache.entries.clear()
+        searches, records = sync(mock_session, searching)
+    finally:
+        ITEMS[0]["files"][0]["size"] = 100
+    assert len(searches) == 1
+    assert [record["file_size"] for record in stored_during_search] == [100]
+    assert [record["file_size"] for record in records] == [200]
@@ -0,0 +1,60 @@
+import os
+import shutil
+
+import pytest
+
+from functions import stremFilesystemFunctions
+from functions.stremFilesystemFunctions import MOUNT_PATH, STRM_MANIFEST_PATH, reconcileStrm
+
+def createEpisode(episode: int):
+    return {
+        "download_link": f"https://api.torbox.app/v1/api/torrents/requestdl?torrent_id=1&file_id={episode}&redirect=true",
+        "metadata_mediatype": "series",
+        "metadata_rootfoldername": "Show (2020)",
+        "metadata_foldername": "Season 1",
+        "metadata_filename": f"Show (2020) S01E{episode:02d}",
+    }
+
+def getStremPath(episode: int):
+    return os.path.join(MOUNT_PATH, "series", "Show (2020)", "Season 1", f"Show (2020) S01E{episode:02d}.strm")
+
+@pytest.fixture(params=[False, True], ids=["in-place", "staged"])
+def library(request, monkeypatch):
+    monkeypatch.setattr(stremFilesystemFunctions, "STRM_STAGED", request.param)
+    shutil.rmtree(MOUNT_PATH, ignore_errors=True)
+    os.makedirs(MOUNT_PATH)
+    if os.path.exists(STRM_MANIFEST_PATH):
+        os.remove(STRM_MANIFEST_PATH)
+    downloads = [createEpisode(episode) for episode in range(1, 4)]
+    counts = reconcileStrm(downloads)
+    assert counts["created"] == 3
+    return downloads
+
+def test_files_deleted_outside_of_the_app_are_created_again(library):
+    os.remove(getStremPath(2))
+    counts = reconcileStrm(library)
+    assert counts["created"] == 1
+    assert counts["unchanged"] == 2
+    with open(getStremPath(2)) as file:
+        assert file.read() == library[1]["download_link"]
+
+def test_wiped_library_is_created_again(library):
+    for folder in ["movies", "series", ".generations"]:
+        path = os.path.join(MOUNT_PATH, folder)
+        if os.path.islink(path):
+            os.remove(path)
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+    counts = reconcileStrm(library)
+    assert counts["created"] == 3
+    assert all(os.path.exists(getStremPath(episode)) for episode in range(1, 4))
+
+def test_files_that_are_not_text_are_written_again(library):
+    os.remove(STRM_MANIFEST_PATH)
+    with open(getStremPath(1), "wb") as file:
+        file.write(b"\xff\xfe\x00")
+    counts = reconcileStrm(library)
+    assert counts["updated"] == 1
+    assert counts["unchanged"] == 2
+    with open(getStremPath(1)) as file:
+        assert file.read() == library[0]["download_link"]
@@ -0,0 +1,83 @@
+import asyncio
+
+import httpx
+
+from functions import torboxFunctions
+from functions.torboxFunctions import DownloadType, getTitleGroupKey, parseFile, processFiles
+
+SHOWS = {
+    "breaking bad": {"title": "Breaking Bad", "type": "series", "releaseYears": 2008},
+    "the wire": {"title": "The Wire", "type": "series", "releaseYears": 2002},
+    "iron man": {"title": "Iron Man", "type": "movie", "releaseYears": 2008},
+    "thor": {"title": "Thor", "type": "movie", "releaseYears": 2011},
+}
+
+def createPack(item_id: int, name: str):
+    files = [
+        {"id": episode, "short_name": f"S01E{episode:02d}.mkv", "name": f"{name}/S01E{episode:02d}.mkv", "size": 100, "mimetype": "video/x-matroska"}
+        for episode in range(1, 4)
+    ]
+    return {"id": item_id, "hash": f"hash{item_id}", "name": name, "created_at": "2024-05-01T12:00:00Z", "cached": True, "files": files}
+
+def search(request: httpx.Request):
+    # the file name comes last in the query, the first match is the title it names
+    query = request.url.path.lower().replace(".", " ")
+    matches = sorted((query.rfind(key), key) for key in SHOWS if key in query)
+    data = [SHOWS[key] for _, key in reversed(matches)]
+    return httpx.Response(200, json={"data": data})
+
+def test_packs_with_same_file_names_are_grouped_apart():
+    breaking_bad = createPack(1, "Breaking Bad S01 1080p")
+    the_wire = createPack(2, "The Wire S01 1080p")
+    keys = set()
+    for item in [breaking_bad, the_wire]:
+        _, title_data, query, _ = parseFile(item, item["files"][0], DownloadType.torrent)
+        keys.add(getTitleGroupKey(item, query, title_data))
+    assert len(keys) == 2
+
+def test_packs_with_same_file_names_get_their_own_metadata(mock_session):
+    breaking_bad = createPack(3, "Breaking Bad S01 1080p")
+    the_wire = createPack(4, "The Wire S01 1080p")
+    files_to_process = [(item, file) for item in [breaking_bad, the_wire] for file in item["files"]]
+
+    async def run():
+        session = await mock_session(search=search)
+        try:
+            return await processFiles(session, files_to_process, DownloadType.torrent)
+        finally:
+            await session.close()
+
+    files = asyncio.run(run())
+    roots = {(f["item_id"], f["metadata_rootfoldername"]) for f in files}
+    assert roots == {(3, "Breaking Bad (2008)"), (4, "The Wire (2002)")}
+    paths = {(f["metadata_rootfoldername"], f["metadata_filename"]) for f in files}
+    assert len(paths) == len(files) == 6
+
+def test_hash_named_downloads_are_grouped_by_file_title():
+    item = createPack(5, "hash5")
+    item["name"] = item["hash"]
+    item["files"][0]["short_name"] = "Breaking.Bad.S01E01.mkv"
+    _, title_data, query, full_title = parseFile(item, item["files"][0], DownloadType.torrent)
+    assert getTitleGroupKey(item, query, title_data) == torboxFunctions.getMetadataCacheKey("Breaking Bad ")
+    assert item["name"] == "hash5"
+    assert full_title == "Breaking Bad Breaking.Bad.S01E01.mkv"
+
+def test_movies_of_a_collection_are_searched_apart(mock_session):
+    files = [
+        {"id": index, "short_name": short_name, "name": f"Marvel Collection 1080p/{short_name}", "size": 100, "mimetype": "video/x-matroska"}
+        for index, short_name in enumerate(["Iron.Man.2008.1080p.mkv", "Thor.2011.1080p.mkv"])
+    ]
+    item = {"id": 6, "hash": "hash6", "name": "Marvel Collection 1080p", "created_at": "2024-05-01T12:00:00Z", "cached": True, "files": files}
+
+    async def run():
+        session = await mock_session(search=search)
+        try:
+            return await processFiles(session, [(item, file) for file in files], DownloadType.torrent)
+        finally:
+            await session.close()
+
+    stored = asyncio.run(run())
+    assert {(f["file_name"], f["metadata_rootfoldername"]) for f in stored} == {
+        ("Iron.Man.2008.1080p.mkv", "Iron Man (2008)"),
+        ("Thor.2011.1080p.mkv", "Thor (2011)"),
+    }
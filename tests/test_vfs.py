@@ -0,0 +1,63 @@
+import stat
+
+import pytest
+
+pytest.importorskip("fuse")
+
+from functions.fuseFilesystemFunctions import VirtualFileSystem, diffFiles, getFilePath # noqa: E402
+from functions.torboxFunctions import getApiDownloadLink # noqa: E402
+
+def createEpisode(item_id: int, episode: int, show: str = "Show (2020)"):
+    return {
+        "type": "torrents",
+        "item_id": item_id,
+        "file_id": episode,
+        "file_name": f"Show.S01E{episode:02d}.mkv",
+        "file_size": 100 + episode,
+        "download_link": f"https://api.torbox.app/v1/api/torrents/requestdl?torrent_id={item_id}&file_id={episode}&redirect=true",
+        "created_at": "2024-05-01T12:00:00Z",
+        "metadata_mediatype": "series",
+        "metadata_rootfoldername": show,
+        "metadata_foldername": "Season 1",
+        "metadata_filename": f"{show} S01E{episode:02d}.mkv",
+    }
+
+def listFiles(vfs: VirtualFileSystem):
+    return sorted((path, node.key, node.st_size) for path, node in vfs.iter_files())
+
+def test_applied_changes_match_a_full_build():
+    files = [createEpisode(1, episode) for episode in range(1, 6)]
+    added, removed, file_index = diffFiles({}, files)
+    vfs = VirtualFileSystem().apply(files, added, [])
+
+    changed = [dict(f) for f in files[1:]]
+    changed[0]["file_size"] += 1
+    changed[1]["metadata_rootfoldername"] = "Other Show (2021)"
+    added, removed, file_index = diffFiles(file_index, changed)
+    assert len(added) == 2
+    assert len(removed) == 3
+    updated = vfs.apply(changed, added, vfs.find_files(removed))
+
+    assert listFiles(updated) == listFiles(VirtualFileSystem(changed))
+    assert updated.list_dir("/series") == ["Other Show (2021)", "Show (2020)"]
+    assert updated.get_stat(getFilePath(files[0])) is None
+    # the previous view is left as it was
+    assert listFiles(vfs) == listFiles(VirtualFileSystem(files))
+
+def test_nodes_are_their_own_stat():
+    files = [createEpisode(1, 1)]
+    vfs = VirtualFileSystem(files)
+    st = vfs.get_stat(getFilePath(files[0]))
+    assert st is vfs.get_stat(getFilePath(files[0]))
+    assert st.st_mode == stat.S_IFREG | 0o444
+    assert st.st_size == 101
+    assert st.st_mtime == st.st_atime == st.st_ctime == 1714564800
+    assert stat.S_ISDIR(vfs.get_stat("/series/Show (2020)").st_mode)
+    assert vfs.get_stat("/").st_nlink == 2
+    assert vfs.get_stat("/series/Missing (2020)") is None
+
+def test_nodes_build_their_link_from_their_key():
+    files = [createEpisode(7, 3)]
+    node = VirtualFileSystem(files).get_file(getFilePath(files[0]))
+    assert not hasattr(node, "__dict__")
+    assert node.download_link == getApiDownloadLink("torrents", 7, 3)